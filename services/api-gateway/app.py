@@ -1,10 +1,20 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import urlencode
 import requests
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, get_jwt_identity, jwt_required
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from balancer import UpstreamUnavailable, Upstreams
+from cache import ResponseCache
+from coalesce import SingleFlight
 from config import Config
+from read_through import ReadThrough
+from transport import forwarded_headers, response_headers, stream_body
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -22,37 +32,165 @@ limiter = Limiter(
 # Microservices Mapping
 SERVICES = Config.SERVICES
 
+# Pooled keep-alive connections to every replica of every service, shared across threads,
+# with load balancing, health ejection, circuit breakers and budgeted retries
+upstreams = Upstreams(
+    SERVICES, Config.UPSTREAM_POLICY,
+    health_check_interval=Config.HEALTH_CHECK_INTERVAL,
+    health_check_timeout=Config.HEALTH_CHECK_TIMEOUT,
+)
+
+# Cached GET responses of read-mostly services (cache_ttl in Config.SERVICES)
+cache = ResponseCache(Config.CACHE_MAX_ENTRIES, Config.CACHE_MAX_BODY_SIZE)
+
+# Identical in-flight GETs are coalesced into one upstream call
+single_flight = SingleFlight()
+
+# Cache and coalescing policy of GETs, shared with async_app.py
+reads = ReadThrough(SERVICES, cache, single_flight)
+
+# Worker threads for the composition endpoints' concurrent upstream calls
+compose_pool = ThreadPoolExecutor(max_workers=Config.COMPOSE_MAX_WORKERS, thread_name_prefix="compose")
+
+def fetch_buffered(service, endpoint, query_string, headers):
+    """GET from a service and buffer the (still encoded) body"""
+    response = upstreams[service].request("GET", endpoint, query_string, headers, stream=True)
+    body = b"".join(stream_body(response))
+    # raw.headers keeps repeated headers apart (requests' own dict joins them with commas)
+    return response.status_code, response_headers(response.raw.headers), body
+
+def read_through(service, endpoint, query_string, headers, current_user):
+    """Buffered GET honouring the service's cache and coalescing policy.
+    Returns (status, headers, body); headers are (name, value) pairs and carry X-Cache / X-Coalesced."""
+    return reads.get(
+        lambda: fetch_buffered(service, endpoint, query_string, headers),
+        service, endpoint, query_string, current_user,
+    )
+
 @app.route('/api/<service>/<path:endpoint>', methods=['GET', 'POST', 'PUT', 'DELETE'])
-@limiter.limit("10 per second")  # Limits each client to 10 requests per second
+@limiter.limit(Config.RATE_LIMIT_BURST)  # Limits each client to 10 requests per second
 @jwt_required(optional=True)  # JWT Optional for now; Can enforce authentication later
 def proxy(service, endpoint):
     """Routes API requests to the correct microservice"""
     if service not in SERVICES:
         return jsonify({"error": "Service not found"}), 404
 
-    # Ensure API calls start with /api/ in the microservices
-    url = f"{SERVICES[service]}/api/{endpoint}"  
     method = request.method
-    headers = {key: value for key, value in request.headers if key != "Host"}
-    data = request.get_json(silent=True)
+    headers = forwarded_headers(request.headers)
     current_user = get_jwt_identity()
 
     try:
-        if method == "GET":
-            response = requests.get(url, params=request.args, headers=headers)
-        elif method == "POST":
-            response = requests.post(url, json=data, headers=headers)
-        elif method == "PUT":
-            response = requests.put(url, json=data, headers=headers)
-        elif method == "DELETE":
-            response = requests.delete(url, headers=headers)
-        else:
-            return jsonify({"error": "Method not allowed"}), 405
-
-        return response.json(), response.status_code
+        if reads.applies(service, method):
+            status, upstream_headers, body = read_through(service, endpoint, request.query_string, headers, current_user)
+            return Response(body, status=status, headers=upstream_headers)
+
+        # Ensure API calls start with /api/ in the microservices
+        response = upstreams[service].request(
+            method, endpoint, request.query_string, headers, request.get_data(), stream=True
+        )
+
+        # ✅ Writes make this service's (and dependent services') cached reads stale
+        if method != "GET":
+            reads.invalidate(service)
+
+        # Stream the body through untouched: no JSON decode/re-encode, any content type
+        return Response(
+            stream_with_context(stream_body(response)),
+            status=response.status_code,
+            headers=response_headers(response.raw.headers),
+        )
+    except UpstreamUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except (requests.exceptions.Timeout, TimeoutError) as e:
+        return jsonify({"error": str(e)}), 504
     except requests.exceptions.RequestException as e:
         return jsonify({"error": str(e)}), 500
 
+def fetch_part(service, endpoint, query_string, headers, current_user):
+    """One part of a composed response: (status, decoded JSON body)"""
+    status, _, body = read_through(service, endpoint, query_string, headers, current_user)
+    return status, json.loads(body) if body else None
+
+def collect_part(name, future, deadline, parts, errors):
+    """Wait for a part until its deadline; a failed or late part is left null and reported"""
+    try:
+        status, data = future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        errors[name] = "timeout"
+        return None
+    except UpstreamUnavailable as e:
+        errors[name] = str(e)
+        return None
+    except (requests.exceptions.RequestException, TimeoutError, ValueError) as e:
+        errors[name] = str(e) or type(e).__name__
+        return None
+    if status >= 400:
+        errors[name] = (data or {}).get("error") or (data or {}).get("message") or f"HTTP {status}"
+        return status
+    parts[name] = data
+    return status
+
+def identity_user_id(identity):
+    """User id of a JWT identity: auth issues {"id", "username", "role"}, older tokens a bare id"""
+    if isinstance(identity, dict):
+        return identity.get("id")
+    return identity
+
+@app.route('/api/compose/product/<product_id>', methods=['GET'])
+@limiter.limit(Config.RATE_LIMIT_BURST)
+@jwt_required(optional=True)
+def compose_product(product_id):
+    """Product detail page in one round-trip: product, category, reviews and the user's cart"""
+    # Composed parts are decoded here, so ask the backends for unencoded bodies
+    headers = {**forwarded_headers(request.headers), "Accept-Encoding": "identity"}
+    current_user = get_jwt_identity()
+    user_id = request.args.get("user_id") or identity_user_id(current_user)
+    timeouts = Config.COMPOSE_TIMEOUTS
+    start = time.monotonic()
+
+    # ✅ Independent parts are fetched concurrently; the category needs the product first
+    reviews_query = urlencode({"limit": request.args.get("reviews_limit", 5)})
+    futures = {
+        "product": compose_pool.submit(fetch_part, "products", f"products/{product_id}", b"", headers, current_user),
+        "reviews": compose_pool.submit(fetch_part, "reviews", f"reviews/product/{product_id}", reviews_query, headers, current_user),
+    }
+    if user_id:
+        futures["cart"] = compose_pool.submit(fetch_part, "cart", "cart", urlencode({"user_id": user_id}), headers, current_user)
+
+    parts, errors = {}, {}
+    status = collect_part("product", futures["product"], start + timeouts["product"], parts, errors)
+    if "product" not in parts:
+        # Without the product there is nothing to compose
+        if status == 404:
+            return jsonify({"error": "Product not found"}), 404
+        return jsonify({"error": errors["product"]}), 504 if errors["product"] == "timeout" else 502
+
+    category_id = parts["product"].get("category")
+    if category_id:
+        category_start = time.monotonic()
+        futures["category"] = compose_pool.submit(
+            fetch_part, "categories", f"categories/{category_id}", b"", headers, current_user
+        )
+        collect_part("category", futures["category"], category_start + timeouts["category"], parts, errors)
+    for name in ("reviews", "cart"):
+        if name in futures:
+            collect_part(name, futures[name], start + timeouts[name], parts, errors)
+
+    # ✅ Partial results: missing parts are null and listed in "errors"
+    return jsonify({
+        "product": parts["product"],
+        "category": parts.get("category"),
+        "reviews": parts.get("reviews"),
+        "cart": parts.get("cart"),
+        "partial": bool(errors),
+        "errors": errors,
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request coalescing counters and replica/circuit state per service"""
+    return jsonify({"coalescing": single_flight.metrics(), "upstreams": upstreams.status()}), 200
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check for API Gateway"""
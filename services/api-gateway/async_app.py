@@ -0,0 +1,173 @@
+"""Asynchronous (ASGI) API Gateway.
+
+Same /api/<service>/<endpoint> routing, optional JWT and rate limits as app.py,
+and the same replica balancing, circuit breakers, retries, hedging, response cache
+and request coalescing (balancer.py, read_through.py), but every upstream call is
+awaited on one event loop instead of holding a thread, so thousands of slow backend
+calls can be in flight at once. The /api/compose/... endpoints are Flask-only.
+
+Run with: uvicorn async_app:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiohttp
+import jwt
+import uvicorn
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import MovingWindowRateLimiter
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from balancer import UpstreamUnavailable, Upstreams
+from cache import ResponseCache
+from coalesce import SingleFlight
+from config import Config
+from read_through import ReadThrough
+from transport import STREAM_CHUNK_SIZE, forwarded_headers, response_headers
+
+# Microservices Mapping
+SERVICES = Config.SERVICES
+
+# Rate Limiting (same limits as the Flask gateway, per client address)
+rate_limiter = MovingWindowRateLimiter(MemoryStorage())
+RATE_LIMITS = [parse(Config.RATE_LIMIT), parse(Config.RATE_LIMIT_BURST)]
+
+# Every replica of every service (the `endpoints` of Config.SERVICES), balanced like app.py;
+# their aiohttp pools are opened on startup
+upstreams = Upstreams(
+    SERVICES, Config.UPSTREAM_POLICY,
+    health_check_interval=Config.HEALTH_CHECK_INTERVAL,
+    health_check_timeout=Config.HEALTH_CHECK_TIMEOUT,
+)
+
+# Cached and coalesced GETs, with the same per-service policy as app.py
+cache = ResponseCache(Config.CACHE_MAX_ENTRIES, Config.CACHE_MAX_BODY_SIZE)
+single_flight = SingleFlight()
+reads = ReadThrough(SERVICES, cache, single_flight)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await upstreams.open_async()
+    yield
+    await upstreams.close_async()
+
+
+def rate_limited(request):
+    """True when the client is over one of the configured limits"""
+    if not Config.RATELIMIT_ENABLED:
+        return False
+    client = request.client.host if request.client else "unknown"
+    # Every limit records the hit, as flask-limiter does, even once one is exceeded
+    hits = [rate_limiter.hit(limit, "gateway", client) for limit in RATE_LIMITS]
+    return not all(hits)
+
+
+def client_headers(pairs):
+    """(name, value) pairs as Starlette headers; unlike a dict, a repeated header keeps every value"""
+    return Headers(raw=[(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in pairs])
+
+
+def jwt_error(request):
+    """Optional JWT: a missing token is fine, an invalid one is rejected like flask-jwt-extended does"""
+    authorization = request.headers.get("authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    try:
+        claims = jwt.decode(authorization[7:], Config.JWT_SECRET_KEY, algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        return JSONResponse({"msg": "Token has expired"}, status_code=401)
+    except jwt.InvalidTokenError as e:
+        return JSONResponse({"msg": str(e)}, status_code=422)
+    request.state.current_user = claims.get("sub")
+    return None
+
+
+async def fetch_buffered(service, endpoint, query_string, headers):
+    """GET from a service and buffer the (still encoded) body"""
+    response = await upstreams[service].request_async("GET", endpoint, query_string, headers)
+    try:
+        body = await response.read()
+    finally:
+        response.release()
+    return response.status, response_headers(response.headers), body
+
+
+async def proxy(request):
+    """Routes API requests to the correct microservice"""
+    service = request.path_params["service"]
+    endpoint = request.path_params["endpoint"]
+
+    if rate_limited(request):
+        return JSONResponse({"error": "Rate limit exceeded"}, status_code=429)
+    error = jwt_error(request)
+    if error is not None:
+        return error
+    if service not in SERVICES:
+        return JSONResponse({"error": "Service not found"}, status_code=404)
+
+    method = request.method
+    headers = forwarded_headers(request.headers.items())
+    query_string = request.url.query
+    current_user = getattr(request.state, "current_user", None)
+
+    try:
+        if reads.applies(service, method):
+            status, upstream_headers, body = await reads.get_async(
+                lambda: fetch_buffered(service, endpoint, query_string, headers),
+                service, endpoint, query_string, current_user,
+            )
+            return Response(body, status_code=status, headers=client_headers(upstream_headers))
+
+        # Ensure API calls start with /api/ in the microservices
+        response = await upstreams[service].request_async(
+            method, endpoint, query_string, headers, await request.body()
+        )
+
+        # ✅ Writes make this service's (and dependent services') cached reads stale
+        if method != "GET":
+            reads.invalidate(service)
+    except UpstreamUnavailable as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
+    except (asyncio.TimeoutError, TimeoutError) as e:
+        return JSONResponse({"error": str(e) or "Upstream timeout"}, status_code=504)
+    except aiohttp.ClientError as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    # Stream the body through untouched, still content-encoded
+    return StreamingResponse(
+        response.content.iter_chunked(STREAM_CHUNK_SIZE),
+        status_code=response.status,
+        headers=client_headers(response_headers(response.headers)),
+        background=BackgroundTask(response.release),
+    )
+
+
+async def metrics(request):
+    """Request coalescing counters and replica/circuit state per service"""
+    return JSONResponse({"coalescing": single_flight.metrics(), "upstreams": upstreams.status()})
+
+
+async def health_check(request):
+    """Health check for API Gateway"""
+    return JSONResponse({"status": "API Gateway running"})
+
+
+app = Starlette(
+    routes=[
+        Route("/api/{service}/{endpoint:path}", proxy, methods=["GET", "POST", "PUT", "DELETE"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/health", health_check, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    uvicorn.run(app, host=Config.HOST, port=Config.PORT)
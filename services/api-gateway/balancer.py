@@ -0,0 +1,411 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import requests
+from transport import AsyncServiceTransport, ServiceTransport
+
+# Only safe-to-repeat requests are retried. PUT/DELETE are idempotent per HTTP,
+# but here they apply order transitions and stock changes, so they are never retried.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Upstream statuses that mean "this replica could not serve the request"
+RETRYABLE_STATUSES = {502, 503, 504}
+
+# Latency samples kept per service, and how many are needed before hedging starts
+HEDGE_WINDOW = 500
+HEDGE_MIN_SAMPLES = 20
+
+
+class UpstreamUnavailable(Exception):
+    """No replica may be tried: the service's circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures; after
+    `reset_timeout` seconds one trial request is let through (half-open)."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class RequestBudget:
+    """Caps extra requests (retries, hedges) to a fraction of traffic: every request
+    deposits `ratio` tokens, every extra request spends one, so they cannot amplify load."""
+
+    def __init__(self, ratio=0.2, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+def _discard(future):
+    """Done-callback closing the response of a request nobody is waiting for"""
+    if future.exception() is None:
+        future.result().close()
+
+
+def _discard_async(task):
+    """_discard() for the async gateway's aiohttp responses"""
+    if not task.cancelled() and task.exception() is None:
+        task.result().release()
+
+
+class Replica:
+    """One backend instance with its own connection pool and load/health state"""
+
+    def __init__(self, url, settings):
+        self.url = url
+        self.pool_settings = {
+            "max_connections": settings.get("max_connections", 20),
+            "connect_timeout": settings.get("connect_timeout", 2.0),
+            "read_timeout": settings.get("read_timeout", 10.0),
+        }
+        self.transport = ServiceTransport(url, **self.pool_settings)
+        # aiohttp pool of the async gateway, opened by Upstreams.open_async()
+        self.async_transport = None
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+
+
+class ServicePool:
+    """Replicas of one service: least-outstanding-requests balancing, passive and
+    active (/health) ejection, a circuit breaker and budgeted retries."""
+
+    def __init__(self, name, settings, defaults):
+        self.name = name
+        endpoints = settings.get("endpoints") or [settings["url"]]
+        self.replicas = [Replica(url, settings) for url in endpoints]
+        self.max_attempts = settings.get("max_attempts", defaults["max_attempts"])
+        self.eject_after = settings.get("eject_after", defaults["eject_after"])
+        self.breaker = CircuitBreaker(
+            settings.get("breaker_failure_threshold", defaults["breaker_failure_threshold"]),
+            settings.get("breaker_reset_timeout", defaults["breaker_reset_timeout"]),
+        )
+        self.retry_budget = RequestBudget(settings.get("retry_budget", defaults["retry_budget"]))
+
+        # Hedging (opt-in): a GET still unanswered after the service's latency percentile
+        # is raced against a second replica
+        self.hedge = settings.get("hedge", False)
+        self.hedge_percentile = settings.get("hedge_percentile", defaults["hedge_percentile"])
+        self.hedge_min_delay = settings.get("hedge_min_delay", defaults["hedge_min_delay"])
+        self.hedge_budget = RequestBudget(settings.get("hedge_budget", defaults["hedge_budget"]))
+        self.hedge_delay = None
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self._latencies = deque(maxlen=HEDGE_WINDOW)
+        self._samples = 0
+        if self.hedge:
+            self._executor = ThreadPoolExecutor(
+                max_workers=2 * settings.get("max_connections", 20) * len(self.replicas),
+                thread_name_prefix=f"hedge-{name}",
+            )
+        self._lock = threading.Lock()
+
+    def pick(self, exclude=()):
+        """Healthy replica with the fewest in-flight requests (random among ties).
+        If every replica is ejected, all of them are candidates again."""
+        with self._lock:
+            candidates = [r for r in self.replicas if r.healthy and r not in exclude]
+            if not candidates:
+                candidates = [r for r in self.replicas if r not in exclude] or self.replicas
+            fewest = min(r.outstanding for r in candidates)
+            replica = random.choice([r for r in candidates if r.outstanding == fewest])
+            replica.outstanding += 1
+            return replica
+
+    def _finish(self, replica, failed):
+        with self._lock:
+            replica.outstanding -= 1
+            if failed:
+                replica.consecutive_failures += 1
+                if replica.consecutive_failures >= self.eject_after:
+                    replica.healthy = False
+            else:
+                replica.consecutive_failures = 0
+
+    def _record_latency(self, seconds):
+        """Track response times; the hedge delay is re-derived every 20 samples"""
+        with self._lock:
+            self._latencies.append(seconds)
+            self._samples += 1
+            if self._samples % 20 == 0 and len(self._latencies) >= HEDGE_MIN_SAMPLES:
+                ordered = sorted(self._latencies)
+                index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+                self.hedge_delay = max(self.hedge_min_delay, ordered[index])
+
+    def send(self, replica, method, endpoint, query_string=b"", headers=None, body=None, stream=False):
+        """One attempt on a replica picked with pick(); updates its load and health state"""
+        start = time.monotonic()
+        try:
+            response = replica.transport.request(method, endpoint, query_string, headers, body, stream)
+        except requests.exceptions.RequestException:
+            self._finish(replica, failed=True)
+            raise
+        failed = response.status_code in RETRYABLE_STATUSES
+        self._finish(replica, failed)
+        if self.hedge and not failed:
+            self._record_latency(time.monotonic() - start)
+        return response
+
+    def _hedged_send(self, replica, tried, *args):
+        """send() to `replica`; if it has not answered within the hedge delay, send the
+        same request to another replica and keep whichever answers first"""
+        first = self._executor.submit(self.send, replica, *args)
+        try:
+            return first.result(timeout=self.hedge_delay)
+        except FutureTimeout:
+            pass
+        if not self.hedge_budget.withdraw():
+            return first.result()
+
+        second_replica = self.pick(exclude=tried)
+        tried.append(second_replica)
+        second = self._executor.submit(self.send, second_replica, *args)
+        with self._lock:
+            self.hedges_sent += 1
+
+        winner, pending = first, {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            answered = [
+                f for f in done
+                if f.exception() is None and f.result().status_code not in RETRYABLE_STATUSES
+            ]
+            if answered:
+                winner = answered[0]
+                break
+        if winner is second:
+            with self._lock:
+                self.hedges_won += 1
+        # The losing request cannot be interrupted mid-flight: drop its response as soon
+        # as it arrives so the connection goes back to the pool
+        loser = second if winner is first else first
+        loser.add_done_callback(_discard)
+        return winner.result()
+
+    def _admit(self, method):
+        """Check the circuit breaker and fund the budgets; returns (retryable, hedged)"""
+        if not self.breaker.allow():
+            raise UpstreamUnavailable(f"Service '{self.name}' unavailable (circuit open)")
+        self.retry_budget.deposit()
+
+        retryable = method in IDEMPOTENT_METHODS
+        hedged = retryable and self.hedge
+        if hedged:
+            self.hedge_budget.deposit()
+        return retryable, hedged
+
+    def _may_retry(self, retryable, tried):
+        return retryable and len(tried) < self.max_attempts and self.retry_budget.withdraw()
+
+    def request(self, method, endpoint, query_string=b"", headers=None, body=None, stream=False):
+        """Send a request to the service, retrying idempotent ones on another replica"""
+        retryable, hedged = self._admit(method)
+        tried = []
+        while True:
+            replica = self.pick(exclude=tried)
+            tried.append(replica)
+            args = (method, endpoint, query_string, headers, body, stream)
+            try:
+                if hedged and self.hedge_delay is not None:
+                    response = self._hedged_send(replica, tried, *args)
+                else:
+                    response = self.send(replica, *args)
+            except requests.exceptions.RequestException:
+                self.breaker.record_failure()
+                if self._may_retry(retryable, tried):
+                    continue
+                raise
+            if response.status_code in RETRYABLE_STATUSES:
+                self.breaker.record_failure()
+                if self._may_retry(retryable, tried):
+                    response.close()
+                    continue
+            else:
+                self.breaker.record_success()
+            return response
+
+    async def send_async(self, replica, method, endpoint, query_string=b"", headers=None, body=None):
+        """send() over the replica's aiohttp transport (the async gateway)"""
+        start = time.monotonic()
+        try:
+            response = await replica.async_transport.request(method, endpoint, query_string, headers, body)
+        except AsyncServiceTransport.errors:
+            self._finish(replica, failed=True)
+            raise
+        except asyncio.CancelledError:
+            # The client went away: release the slot without counting it against the replica
+            self._finish(replica, failed=False)
+            raise
+        failed = response.status in RETRYABLE_STATUSES
+        self._finish(replica, failed)
+        if self.hedge and not failed:
+            self._record_latency(time.monotonic() - start)
+        return response
+
+    async def _hedged_send_async(self, replica, tried, *args):
+        """_hedged_send() with tasks on the event loop instead of worker threads"""
+        first = asyncio.ensure_future(self.send_async(replica, *args))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        if done or not self.hedge_budget.withdraw():
+            return await first
+
+        second_replica = self.pick(exclude=tried)
+        tried.append(second_replica)
+        second = asyncio.ensure_future(self.send_async(second_replica, *args))
+        with self._lock:
+            self.hedges_sent += 1
+
+        winner, pending = first, {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            answered = [
+                t for t in done
+                if t.exception() is None and t.result().status not in RETRYABLE_STATUSES
+            ]
+            if answered:
+                winner = answered[0]
+                break
+        if winner is second:
+            with self._lock:
+                self.hedges_won += 1
+        # Not cancelled, so its replica's load and health are still accounted for
+        loser = second if winner is first else first
+        loser.add_done_callback(_discard_async)
+        return winner.result()
+
+    async def request_async(self, method, endpoint, query_string=b"", headers=None, body=None):
+        """request() for the async gateway: same balancing, ejection, circuit breaker,
+        retries and hedging, over the replicas' aiohttp transports. The body is left unread."""
+        retryable, hedged = self._admit(method)
+        tried = []
+        while True:
+            replica = self.pick(exclude=tried)
+            tried.append(replica)
+            args = (method, endpoint, query_string, headers, body)
+            try:
+                if hedged and self.hedge_delay is not None:
+                    response = await self._hedged_send_async(replica, tried, *args)
+                else:
+                    response = await self.send_async(replica, *args)
+            except AsyncServiceTransport.errors:
+                self.breaker.record_failure()
+                if self._may_retry(retryable, tried):
+                    continue
+                raise
+            if response.status in RETRYABLE_STATUSES:
+                self.breaker.record_failure()
+                if self._may_retry(retryable, tried):
+                    response.release()
+                    continue
+            else:
+                self.breaker.record_success()
+            return response
+
+    def check_health(self, timeout):
+        """Probe every replica's /health endpoint, ejecting or restoring it"""
+        for replica in self.replicas:
+            try:
+                healthy = requests.get(f"{replica.url}/health", timeout=timeout).status_code == 200
+            except requests.exceptions.RequestException:
+                healthy = False
+            with self._lock:
+                replica.healthy = healthy
+                if healthy:
+                    replica.consecutive_failures = 0
+
+    def status(self):
+        return {
+            "circuit": self.breaker.state,
+            **({"hedge": {
+                "delay_ms": round(self.hedge_delay * 1000, 1) if self.hedge_delay is not None else None,
+                "sent": self.hedges_sent,
+                "won": self.hedges_won,
+            }} if self.hedge else {}),
+            "replicas": [
+                {"url": r.url, "healthy": r.healthy, "outstanding": r.outstanding} for r in self.replicas
+            ],
+        }
+
+
+class Upstreams:
+    """Per-service replica pools built from Config.SERVICES, with a background health checker"""
+
+    def __init__(self, services, defaults, health_check_interval=5.0, health_check_timeout=1.0):
+        self.pools = {name: ServicePool(name, settings, defaults) for name, settings in services.items()}
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        if health_check_interval:
+            threading.Thread(target=self._health_loop, daemon=True).start()
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_check_interval)
+            for pool in self.pools.values():
+                pool.check_health(self.health_check_timeout)
+
+    async def open_async(self):
+        """Open every replica's aiohttp pool; call on the async gateway's event loop"""
+        for pool in self.pools.values():
+            for replica in pool.replicas:
+                replica.async_transport = AsyncServiceTransport(replica.url, **replica.pool_settings)
+
+    async def close_async(self):
+        for pool in self.pools.values():
+            for replica in pool.replicas:
+                if replica.async_transport is not None:
+                    await replica.async_transport.close()
+                    replica.async_transport = None
+
+    def __contains__(self, service):
+        return service in self.pools
+
+    def __getitem__(self, service):
+        return self.pools[service]
+
+    def status(self):
+        return {name: pool.status() for name, pool in self.pools.items()}
@@ -0,0 +1,183 @@
+"""Benchmark the Flask gateway (app.py) against the async gateway (async_app.py).
+
+Both gateways proxy to the same local stub backend, which answers every request
+after a fixed delay to simulate a slow service. Each process runs separately so
+the load generator, the gateway and the stub do not share a GIL.
+
+Usage: python benchmark.py [--concurrency 200] [--requests 4000] [--delay 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+STUB_PORT = 5901
+GATEWAY_PORT = 5900
+SERVICE = "products"
+
+
+async def run_stub(port, delay):
+    """Minimal keep-alive HTTP/1.1 backend answering every request after `delay` seconds"""
+    body = json.dumps({"results": [{"id": "prod-001", "name": "stub"}]}).encode()
+    head = (
+        "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n"
+    ).encode()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request_head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in request_head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                await asyncio.sleep(delay)
+                writer.write(head + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", port, backlog=4096)
+    async with server:
+        await server.serve_forever()
+
+
+def configure_gateway(concurrency):
+    """Point the gateway config at the stub, with rate limiting off and enough connections"""
+    os.environ["RATELIMIT_ENABLED"] = "false"
+    from config import Config
+
+    Config.SERVICES[SERVICE] = {
+        "url": f"http://127.0.0.1:{STUB_PORT}",
+        "max_connections": concurrency,
+        "connect_timeout": 5.0,
+        "read_timeout": 30.0,
+    }
+    return Config
+
+
+def run_flask_gateway(concurrency):
+    configure_gateway(concurrency)
+    from app import app
+
+    app.run(host="127.0.0.1", port=GATEWAY_PORT, debug=False, threaded=True)
+
+
+def run_async_gateway(concurrency):
+    configure_gateway(concurrency)
+    import uvicorn
+    from async_app import app
+
+    uvicorn.run(app, host="127.0.0.1", port=GATEWAY_PORT, log_level="warning")
+
+
+async def wait_ready(url, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def load(concurrency, total):
+    """Fire `total` GETs through the gateway with `concurrency` requests in flight"""
+    url = f"http://127.0.0.1:{GATEWAY_PORT}/api/{SERVICE}/products"
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    async with session.get(url) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+    }
+
+
+def spawn(role, args):
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--role", role,
+         "--concurrency", str(args.concurrency), "--delay", str(args.delay)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def main(args):
+    stub = spawn("stub", args)
+    try:
+        for role in ("flask", "async"):
+            gateway = spawn(role, args)
+            try:
+                asyncio.run(wait_ready(f"http://127.0.0.1:{GATEWAY_PORT}/health"))
+                # Warm up the connection pools before measuring
+                asyncio.run(load(args.concurrency, args.concurrency))
+                result = asyncio.run(load(args.concurrency, args.requests))
+                print(json.dumps({"gateway": role, "concurrency": args.concurrency,
+                                  "backend_delay_ms": args.delay * 1000, **result}))
+            finally:
+                gateway.terminate()
+                gateway.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--role", choices=["bench", "stub", "flask", "async"], default="bench")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--delay", type=float, default=0.05, help="stub backend delay in seconds")
+    args = parser.parse_args()
+
+    if args.role == "stub":
+        asyncio.run(run_stub(STUB_PORT, args.delay))
+    elif args.role == "flask":
+        run_flask_gateway(args.concurrency)
+    elif args.role == "async":
+        run_async_gateway(args.concurrency)
+    else:
+        main(args)
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+
+class CachedResponse:
+    """A buffered upstream response"""
+
+    def __init__(self, status, headers, body, expires_at, generation):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+        self.generation = generation
+
+
+class ResponseCache:
+    """Bounded LRU of upstream responses with per-entry TTLs.
+
+    Every service has a generation counter: invalidating a service bumps it,
+    which turns all of its entries stale at once, including responses that
+    were still in flight when the write happened."""
+
+    def __init__(self, max_entries=1024, max_body_size=1024 * 1024):
+        self.max_entries = max_entries
+        self.max_body_size = max_body_size
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(method, service, endpoint, query_string, scope):
+        """Cache key; the query string is normalized so parameter order does not matter"""
+        if isinstance(query_string, bytes):
+            query_string = query_string.decode()
+        query = urlencode(sorted(parse_qsl(query_string, keep_blank_values=True)))
+        return (method, service, endpoint, query, scope)
+
+    def generation(self, service):
+        """Current generation of a service, to pass back to set()"""
+        with self._lock:
+            return self._generations.get(service, 0)
+
+    def get(self, key):
+        """Return the fresh CachedResponse for `key`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic() or entry.generation != self._generations.get(key[1], 0):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, generation, ttl, status, headers, body):
+        """Store a response fetched while the service was at `generation`"""
+        if len(body) > self.max_body_size:
+            return
+        with self._lock:
+            if generation != self._generations.get(key[1], 0):
+                # The service was written to while this response was in flight
+                return
+            self._entries[key] = CachedResponse(status, headers, body, time.monotonic() + ttl, generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *services):
+        """Drop every cached response of these services"""
+        with self._lock:
+            for service in services:
+                self._generations[service] = self._generations.get(service, 0) + 1
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """One in-flight upstream call and the requests waiting on it"""
+
+    def __init__(self, service, future=None):
+        self.service = service
+        self.done = threading.Event()
+        # Awaited instead of `done` by do_async() waiters
+        self.future = future
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls: the first caller for a key runs it,
+    every caller arriving while it is in flight gets the same result."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _service_stats(self, service):
+        return self._stats.setdefault(service, {"requests": 0, "upstream_calls": 0, "coalesced": 0, "max_waiters": 0})
+
+    def _join(self, key, service, future=None):
+        """The in-flight call for `key`, started if there is none; returns (call, leader)"""
+        with self._lock:
+            stats = self._service_stats(service)
+            stats["requests"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(service, future)
+                stats["upstream_calls"] += 1
+            else:
+                call.waiters += 1
+                stats["coalesced"] += 1
+                stats["max_waiters"] = max(stats["max_waiters"], call.waiters)
+            return call, leader
+
+    def _leave(self, key, call):
+        """The leader is done: wake the waiters"""
+        with self._lock:
+            del self._calls[key]
+        call.done.set()
+        if call.future is not None and not call.future.done():
+            call.future.set_result(None)
+
+    @staticmethod
+    def _outcome(call, leader):
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def do(self, key, service, fn, timeout=None):
+        """Return fn()'s result, sharing it with concurrent callers using the same key.
+        Raises whatever fn() raised, or TimeoutError if a waiter gives up."""
+        call, leader = self._join(key, service)
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                self._leave(key, call)
+        elif not call.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for a coalesced upstream call")
+        return self._outcome(call, leader)
+
+    async def do_async(self, key, service, fn, timeout=None):
+        """do() for the async gateway: fn is a coroutine function, awaited by the first caller
+        only; the others await its result on the same event loop. Use either do() or
+        do_async() on one SingleFlight, not both."""
+        call, leader = self._join(key, service, asyncio.get_running_loop().create_future())
+        if leader:
+            try:
+                call.result = await fn()
+            except asyncio.CancelledError:
+                # The leader's client went away; its waiters must still get an answer
+                call.error = TimeoutError("Coalesced upstream call was cancelled")
+                raise
+            except Exception as e:
+                call.error = e
+            finally:
+                self._leave(key, call)
+        else:
+            try:
+                await asyncio.wait_for(asyncio.shield(call.future), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("Timed out waiting for a coalesced upstream call") from None
+        return self._outcome(call, leader)
+
+    def metrics(self):
+        """Per-service request, upstream call and coalescing counters"""
+        with self._lock:
+            in_flight = {}
+            for call in self._calls.values():
+                in_flight[call.service] = in_flight.get(call.service, 0) + 1 + call.waiters
+            return {
+                service: {
+                    **stats,
+                    "coalescing_ratio": round(stats["coalesced"] / stats["requests"], 4) if stats["requests"] else 0.0,
+                    "waiting_now": in_flight.get(service, 0),
+                }
+                for service, stats in self._stats.items()
+            }
@@ -8,12 +8,89 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "mysecretkey")
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "supersecret")
     
-    # Microservices Mapping with API prefixes
+    RATE_LIMIT = os.getenv("RATE_LIMIT", "100 per minute")
+    RATE_LIMIT_BURST = os.getenv("RATE_LIMIT_BURST", "10 per second")
+    RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "True").lower() == "true"
+
+    # Response cache: max entries and max cacheable body size (bytes)
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 2048))
+    CACHE_MAX_BODY_SIZE = int(os.getenv("CACHE_MAX_BODY_SIZE", 1024 * 1024))
+
+    # Upstream resilience defaults, overridable per service in SERVICES:
+    # - max_attempts: tries per idempotent request, each on a different replica
+    # - retry_budget: retries allowed per request on average (token bucket ratio)
+    # - eject_after: consecutive failures that take a replica out of rotation until /health passes
+    # - breaker_failure_threshold, breaker_reset_timeout: circuit breaker per service (seconds)
+    # - hedge_percentile: latency percentile after which a hedged GET goes to a second replica
+    # - hedge_min_delay: lower bound of that delay (seconds)
+    # - hedge_budget: hedges allowed per request on average (token bucket ratio)
+    UPSTREAM_POLICY = {
+        "max_attempts": int(os.getenv("RETRY_MAX_ATTEMPTS", 2)),
+        "retry_budget": float(os.getenv("RETRY_BUDGET", 0.2)),
+        "eject_after": int(os.getenv("EJECT_AFTER", 3)),
+        "breaker_failure_threshold": int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5)),
+        "breaker_reset_timeout": float(os.getenv("BREAKER_RESET_TIMEOUT", 30.0)),
+        "hedge_percentile": float(os.getenv("HEDGE_PERCENTILE", 95)),
+        "hedge_min_delay": float(os.getenv("HEDGE_MIN_DELAY", 0.01)),
+        "hedge_budget": float(os.getenv("HEDGE_BUDGET", 0.05)),
+    }
+    # Seconds between active /health probes of every replica (0 = off)
+    HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 5.0))
+    HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 1.0))
+
+    # Composition endpoints (/api/compose/...): worker threads and per-part timeouts (seconds)
+    COMPOSE_MAX_WORKERS = int(os.getenv("COMPOSE_MAX_WORKERS", 64))
+    COMPOSE_TIMEOUTS = {
+        "product": float(os.getenv("COMPOSE_PRODUCT_TIMEOUT", 2.0)),
+        "category": float(os.getenv("COMPOSE_CATEGORY_TIMEOUT", 1.0)),
+        "reviews": float(os.getenv("COMPOSE_REVIEWS_TIMEOUT", 1.5)),
+        "cart": float(os.getenv("COMPOSE_CART_TIMEOUT", 1.0)),
+    }
+
+    # Microservices Mapping with API prefixes and per-service policy:
+    # - endpoints: replica URLs balanced by least outstanding requests (defaults to [url])
+    # - max_connections, connect_timeout, read_timeout: connection pool per replica (seconds)
+    # - cache_ttl: seconds GET responses are cached (0 = not cached)
+    # - invalidates: other services whose cached responses a write to this one makes stale
+    # - coalesce: identical concurrent GETs share one upstream call (always on with cache_ttl)
+    # - hedge: slow GETs are raced against a second replica (see UPSTREAM_POLICY)
     SERVICES = {
-        "auth": "http://127.0.0.1:5001",
-        "products": "http://127.0.0.1:5002",
-        "categories": "http://127.0.0.1:5003",
-        "search": "http://127.0.0.1:5004",
-        "cart": "http://127.0.0.1:5005",
-        "orders": "http://127.0.0.1:5006",
+        "auth": {
+            "url": "http://127.0.0.1:5001",
+            "max_connections": 20, "connect_timeout": 2.0, "read_timeout": 10.0,
+        },
+        "products": {
+            "url": "http://127.0.0.1:5002",
+            "max_connections": 50, "connect_timeout": 2.0, "read_timeout": 10.0,
+            "cache_ttl": 30, "invalidates": ["search"], "hedge": True,
+        },
+        "categories": {
+            "url": "http://127.0.0.1:5003",
+            "max_connections": 20, "connect_timeout": 2.0, "read_timeout": 10.0,
+            "cache_ttl": 300, "invalidates": ["search"],
+        },
+        "search": {
+            "url": "http://127.0.0.1:5004",
+            "max_connections": 50, "connect_timeout": 2.0, "read_timeout": 5.0,
+            "cache_ttl": 30,
+        },
+        "cart": {
+            "url": "http://127.0.0.1:5005",
+            "max_connections": 20, "connect_timeout": 2.0, "read_timeout": 10.0,
+            "invalidates": ["products", "search"],  # Adding to the cart reserves stock
+        },
+        "orders": {
+            "url": "http://127.0.0.1:5006",
+            "max_connections": 20, "connect_timeout": 2.0, "read_timeout": 30.0,
+            "invalidates": ["products", "search"],  # Confirming an order updates stock
+        },
+        "pets": {
+            "url": "http://127.0.0.1:5007",
+            "max_connections": 20, "connect_timeout": 2.0, "read_timeout": 10.0,
+        },
+        "reviews": {
+            "url": "http://127.0.0.1:5008",
+            "max_connections": 20, "connect_timeout": 2.0, "read_timeout": 10.0,
+            "coalesce": True, "hedge": True,
+        },
     }
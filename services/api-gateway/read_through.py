@@ -0,0 +1,85 @@
+import json
+
+
+class ReadThrough:
+    """Buffered GETs honouring each service's cache_ttl / coalesce policy (Config.SERVICES):
+    fresh cached responses are served from the ResponseCache, identical concurrent reads
+    share one upstream call through SingleFlight. Shared by the Flask gateway (get) and
+    the async one (get_async); responses are (status, [(name, value), ...], body)."""
+
+    def __init__(self, services, cache, single_flight):
+        self.services = services
+        self.cache = cache
+        self.single_flight = single_flight
+
+    def applies(self, service, method):
+        """True when the service's policy sends this request through get() / get_async()"""
+        policy = self.services[service]
+        return method == "GET" and bool(policy.get("cache_ttl") or policy.get("coalesce"))
+
+    def invalidate(self, service):
+        """A write to `service` makes its (and dependent services') cached reads stale"""
+        self.cache.invalidate(service, *self.services[service].get("invalidates", ()))
+
+    def _lookup(self, service, endpoint, query_string, current_user):
+        """(cache key, ttl, cached response or None); cached reads are keyed per user"""
+        ttl = self.services[service].get("cache_ttl", 0)
+        key = self.cache.key("GET", service, endpoint, query_string, json.dumps(current_user, sort_keys=True))
+        cached = self.cache.get(key) if ttl else None
+        if cached is None:
+            return key, ttl, None
+        return key, ttl, (cached.status, cached.headers + [("X-Cache", "HIT")], cached.body)
+
+    def _store(self, key, generation, ttl, response):
+        """Cache a fetched response when allowed, and pass it on"""
+        status, headers, body = response
+        no_store = any(name.lower() == "cache-control" and "no-store" in value for name, value in headers)
+        if ttl and status == 200 and not no_store:
+            self.cache.set(key, generation, ttl, status, headers, body)
+        return response
+
+    def _timeout(self, service):
+        """How long a coalesced request waits for the leader's upstream call"""
+        policy = self.services[service]
+        return policy.get("connect_timeout", 2.0) + policy.get("read_timeout", 10.0)
+
+    @staticmethod
+    def _tagged(response, ttl, coalesced):
+        status, headers, body = response
+        extra = [("X-Cache", "MISS")] if ttl else []
+        if coalesced:
+            extra.append(("X-Coalesced", "true"))
+        return status, headers + extra, body
+
+    def get(self, fetch, service, endpoint, query_string, current_user):
+        """GET through the cache and coalescing; fetch() does the upstream call.
+        Services without a policy are fetched directly."""
+        if not self.applies(service, "GET"):
+            return fetch()
+        key, ttl, cached = self._lookup(service, endpoint, query_string, current_user)
+        if cached is not None:
+            return cached
+
+        generation = self.cache.generation(service)
+        response, coalesced = self.single_flight.do(
+            key, service, lambda: self._store(key, generation, ttl, fetch()), timeout=self._timeout(service)
+        )
+        return self._tagged(response, ttl, coalesced)
+
+    async def get_async(self, fetch, service, endpoint, query_string, current_user):
+        """get() for the async gateway: fetch is a coroutine function"""
+        if not self.applies(service, "GET"):
+            return await fetch()
+        key, ttl, cached = self._lookup(service, endpoint, query_string, current_user)
+        if cached is not None:
+            return cached
+
+        generation = self.cache.generation(service)
+
+        async def fetch_and_store():
+            return self._store(key, generation, ttl, await fetch())
+
+        response, coalesced = await self.single_flight.do_async(
+            key, service, fetch_and_store, timeout=self._timeout(service)
+        )
+        return self._tagged(response, ttl, coalesced)
@@ -0,0 +1,95 @@
+import asyncio
+from urllib.parse import parse_qsl
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+# Size of the chunks streamed from a backend to the client
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Hop-by-hop headers (RFC 7230 §6.1) only apply to a single connection and are never forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade",
+}
+
+
+def forwarded_headers(headers):
+    """Inbound headers that may be passed on to a backend service"""
+    return {
+        key: value for key, value in headers
+        if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() not in ("host", "content-length")
+    }
+
+
+def response_headers(headers):
+    """Upstream response headers to pass on to the client (content-type, content-encoding, ...),
+    as (name, value) pairs: a repeated header such as Set-Cookie keeps every value.
+    `headers` must be a multi-dict whose items() yields repeats (urllib3's raw.headers, aiohttp's headers)."""
+    return [
+        (key, value) for key, value in headers.items()
+        if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() not in ("server", "date")
+    ]
+
+
+def stream_body(upstream):
+    """Yield the upstream body as received, still content-encoded, then release the connection"""
+    try:
+        yield from upstream.raw.stream(STREAM_CHUNK_SIZE, decode_content=False)
+    finally:
+        upstream.close()
+
+
+class ServiceTransport:
+    """Keep-alive connection pool to one backend instance, shared by all gateway threads"""
+
+    def __init__(self, url, max_connections=20, connect_timeout=2.0, read_timeout=10.0):
+        self.url = url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # pool_block: when all connections are busy, wait for one instead of opening extras
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, endpoint, query_string=b"", headers=None, body=None, stream=False):
+        """Send a request to /api/<endpoint> on this service over a pooled connection.
+        With stream=True the body is left unread; consume it with stream_body()."""
+        url = f"{self.url}/api/{endpoint}"
+        if query_string:
+            url = f"{url}?{query_string.decode() if isinstance(query_string, bytes) else query_string}"
+        return self.session.request(
+            method, url, headers=headers, data=body or None, timeout=self.timeout, stream=stream
+        )
+
+
+
+class AsyncServiceTransport:
+    """ServiceTransport for the async gateway: an aiohttp keep-alive pool to one backend
+    instance. Create it on the running event loop and close() it on shutdown."""
+
+    # Connection failures and timeouts, as requests.exceptions.RequestException for ServiceTransport
+    errors = (aiohttp.ClientError, asyncio.TimeoutError)
+
+    def __init__(self, url, max_connections=20, connect_timeout=2.0, read_timeout=10.0):
+        self.url = url.rstrip("/")
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max_connections),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+            # Bodies are streamed through still encoded
+            auto_decompress=False,
+        )
+
+    async def request(self, method, endpoint, query_string=b"", headers=None, body=None):
+        """Send a request to /api/<endpoint> on this service over a pooled connection.
+        The body is left unread: read() or stream it, then release() the response."""
+        if isinstance(query_string, bytes):
+            query_string = query_string.decode()
+        return await self.session.request(
+            method, f"{self.url}/api/{endpoint}",
+            params=parse_qsl(query_string, keep_blank_values=True), headers=headers, data=body or None,
+        )
+
+    async def close(self):
+        await self.session.close()
@@ -2,7 +2,6 @@ from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_swagger_ui import get_swaggerui_blueprint
-import json
 import sys
 import os
 from config import Config
@@ -36,23 +35,19 @@ def get_openapi_yaml():
 def register():
     """Registers a new user"""
     data = request.json
-    for user in users_db:
-        if user["username"] == data["username"]:
-            return jsonify({"message": "User already exists"}), 400
+    if users_db.first_by("username", data["username"]):
+        return jsonify({"message": "User already exists"}), 400
     
     new_user = {
-        "id": f"user-{len(users_db) + 1}",
+        "id": users_db.new_id("user"),
         "username": data["username"],
         "email": data["email"],
         "password": data["password"],  # Hashing should be added in production
         "role": "customer"
     }
     
-    users_db.append(new_user)
-    
-    # Save back to the mock database
-    with open("mock_database.json", "w") as file:
-        json.dump({"users": users_db}, file, indent=4)
+    # Save to the database
+    users_db.insert(new_user)
     
     return jsonify({"message": "User registered successfully"}), 201
 
@@ -60,10 +55,10 @@ def register():
 def login():
     """User login and JWT token generation"""
     data = request.json
-    for user in users_db:
-        if user["username"] == data["username"] and user["password"] == data["password"]:
-            token = create_access_token(identity={"id": user["id"], "username": user["username"], "role": user["role"]})
-            return jsonify(access_token=token), 200
+    user = users_db.first_by("username", data["username"])
+    if user and user["password"] == data["password"]:
+        token = create_access_token(identity={"id": user["id"], "username": user["username"], "role": user["role"]})
+        return jsonify(access_token=token), 200
     
     return jsonify({"message": "Invalid credentials"}), 401
 
@@ -1,15 +1,15 @@
 from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
-import json
 import sys
 import os
 from config import Config
-from datetime import datetime
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
 from utils.database import cart_db, products_db, users_db
-from utils.middleware import validate_json, paginate_data, filter_and_sort_data ,handle_errors ,prevent_duplicates # Middleware
+from utils.inventory import CART_RESERVATION_TTL, InsufficientStock, cart_holder, inventory
+from cart_store import CartStore
+from utils.middleware import validate_json, filter_and_sort_data ,handle_errors # Middleware
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -40,6 +40,39 @@ cart_item_schema = {
     },
     "required": ["user_id", "product_id", "quantity"]
 }
+
+cart_items_schema = {
+    "type": "object",
+    "properties": {
+        "user_id": {"type": "string"},
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "product_id": {"type": "string"},
+                    "quantity": {"type": "integer", "minimum": 1}
+                },
+                "required": ["product_id", "quantity"]
+            },
+            "minItems": 1
+        }
+    },
+    "required": ["user_id", "items"]
+}
+
+cart_quantity_schema = {
+    "type": "object",
+    "properties": {
+        "user_id": {"type": "string"},
+        "quantity": {"type": "integer", "minimum": 0}
+    },
+    "required": ["user_id", "quantity"]
+}
+
+# ✅ Carts keyed by user, items keyed by product
+cart_store = CartStore(cart_db)
+
 @app.route('/api/cart', methods=['GET'])
 @filter_and_sort_data  # ✅ Apply filtering & sorting
 def get_cart():
@@ -50,7 +83,7 @@ def get_cart():
         return jsonify({"error": "User ID is required"}), 400
 
     # ✅ Find user's cart
-    user_cart = next((cart for cart in cart_db if cart["userId"] == user_id), None)
+    user_cart = cart_store.get(user_id)
 
     if not user_cart:
         return jsonify({"user_id": user_id, "items": [], "totalAmount": 0, "createdAt": None}), 200
@@ -81,101 +114,141 @@ def get_cart():
 @app.route('/api/cart/products', methods=['GET'])
 def get_available_products():
     """Retrieve available products for dropdown selection"""
-    product_options = [{"id": p["id"], "name": p["name"], "stock": p["stock"]} for p in products_db]
+    product_options = [{"id": p["id"], "name": p["name"], "stock": inventory.available(p["id"])} for p in products_db]
     return jsonify(product_options), 200
 
 
+def add_items(user_id, requested):
+    """Reserve and add {product_id: quantity} to a user's cart, all or nothing"""
+    # ✅ Check if user exists
+    if not users_db.get(user_id):
+        return jsonify({"error": "User not found"}), 404
+
+    # ✅ Check product availability
+    items = {}
+    for product_id, quantity in requested.items():
+        product = products_db.get(product_id)
+        if not product:
+            return jsonify({"error": f"Product with ID {product_id} not found"}), 404
+        items[product_id] = (quantity, product["price"])
+
+    with cart_store.lock(user_id):
+        # ✅ Reserve the units for this cart (atomic per product, expires if the cart is abandoned)
+        try:
+            inventory.reserve(cart_holder(user_id), requested, ttl=CART_RESERVATION_TTL)
+        except InsufficientStock as e:
+            return jsonify({"error": f"Not enough stock available for {e.product_id}"}), 400
+
+        # ✅ Items are keyed by product: adding one already in the cart increases its quantity
+        user_cart = cart_store.add_items(user_id, items)
+
+    return jsonify(user_cart), 201
+
+
 @app.route('/api/cart', methods=['POST'])
 @validate_json(cart_item_schema)  # ✅ Validate request body
-@prevent_duplicates  # ✅ Prevent Duplicates
 @handle_errors  # ✅ Handle Errors
 def add_to_cart():
     """Add a product to the cart with correct structure"""
     data = request.json
+    return add_items(data["user_id"], {data["product_id"]: data["quantity"]})
 
-    # ✅ Check if user exists
-    user = next((u for u in users_db if u["id"] == data["user_id"]), None)
-    if not user:
-        return jsonify({"error": "User not found"}), 404
 
-    # ✅ Check product availability
-    product = next((p for p in products_db if p["id"] == data["product_id"]), None)
-    if not product:
-        return jsonify({"error": "Product not found"}), 404
+@app.route('/api/cart/items/bulk', methods=['POST'])
+@validate_json(cart_items_schema)  # ✅ Validate request body
+@handle_errors  # ✅ Handle Errors
+def add_many_to_cart():
+    """Add several products to the cart in one call"""
+    data = request.json
+    requested = {}
+    for item in data["items"]:
+        requested[item["product_id"]] = requested.get(item["product_id"], 0) + item["quantity"]
+    return add_items(data["user_id"], requested)
 
-    # ✅ Check stock availability
-    if data["quantity"] > product["stock"]:
-        return jsonify({"error": "Not enough stock available"}), 400
 
-    # ✅ Retrieve or create the user's cart
-    user_cart = next((cart for cart in cart_db if cart["userId"] == data["user_id"]), None)
+@app.route('/api/cart/items/<product_id>', methods=['PUT'])
+@validate_json(cart_quantity_schema)  # ✅ Validate request body
+@handle_errors  # ✅ Handle Errors
+def update_cart_item(product_id):
+    """Change the quantity of a product in the cart (0 removes it)"""
+    data = request.json
+    user_id = data["user_id"]
 
-    if not user_cart:
-        user_cart = {
-            "id": f"cart-{len(cart_db) + 1}",
-            "userId": data["user_id"],
-            "items": [],
-            "totalAmount": 0,
-            "createdAt": datetime.utcnow().isoformat() + "Z"
-        }
-        cart_db.append(user_cart)
+    with cart_store.lock(user_id):
+        if cart_store.get_item(user_id, product_id) is None:
+            return jsonify({"error": "Item not in cart"}), 404
 
-    # ✅ Check if the product is already in the cart
-    existing_item = next((item for item in user_cart["items"] if item["productId"] == data["product_id"]), None)
+        # ✅ The reservation follows the new quantity
+        try:
+            inventory.reserve(cart_holder(user_id), {product_id: data["quantity"]},
+                              ttl=CART_RESERVATION_TTL, replace=True)
+        except InsufficientStock:
+            return jsonify({"error": "Not enough stock available"}), 400
+        user_cart = cart_store.set_quantity(user_id, product_id, data["quantity"])
 
-    if existing_item:
-        # Update quantity
-        existing_item["quantity"] += data["quantity"]
-    else:
-        # Add new item to the cart
-        user_cart["items"].append({
-            "productId": data["product_id"],
-            "quantity": data["quantity"],
-            "price": product["price"]
-        })
+    return jsonify(user_cart), 200
 
-    # ✅ Recalculate the total amount
-    user_cart["totalAmount"] = sum(item["price"] * item["quantity"] for item in user_cart["items"])
 
-    # ✅ Update stock in the product database
-    product["stock"] -= data["quantity"]
+@app.route('/api/cart/items/<product_id>', methods=['DELETE'])
+def remove_cart_item(product_id):
+    """Remove a product from a user's cart (?user_id=)"""
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
 
-    # ✅ Save updated cart and products back to the mock database
-    with open("mock_database.json", "w") as file:
-        json.dump({"cart": cart_db, "products": products_db, "users": users_db}, file, indent=4)
+    with cart_store.lock(user_id):
+        user_cart = cart_store.remove_item(user_id, product_id)
+        if user_cart is None:
+            return jsonify({"error": "Item not in cart"}), 404
+        # ✅ Release the item's reserved units
+        inventory.release(cart_holder(user_id), [product_id])
 
-    return jsonify(user_cart), 201
+    return jsonify(user_cart), 200
+
+
+@app.route('/api/cart', methods=['DELETE'])
+def clear_cart():
+    """Remove every item from a user's cart (?user_id=)"""
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    with cart_store.lock(user_id):
+        removed = cart_store.clear(user_id)
+        inventory.release(cart_holder(user_id), [item["productId"] for item in removed])
+
+    return jsonify({"message": "Cart cleared", "removed": len(removed)}), 200
 
 
 @app.route('/api/cart/items', methods=['GET'])
 def get_cart_items():
     """Retrieve available cart items for dropdown selection"""
-    cart_options = [{"id": item["id"], "product_name": item["product_name"], "user_id": item["user_id"]} for item in cart_db]
+    cart_options = [
+        {
+            "id": cart["id"],
+            "user_id": cart["userId"],
+            "product_id": item["productId"],
+            "product_name": (products_db.get(item["productId"]) or {}).get("name"),
+        }
+        for cart in cart_db for item in cart["items"]
+    ]
     return jsonify(cart_options), 200
 
 
 @app.route('/api/cart/<cart_id>', methods=['DELETE'])
 def remove_from_cart(cart_id):
-    """Remove an item from the cart for a specific user"""
-    global cart_db
-    cart_item = next((item for item in cart_db if item["id"] == cart_id), None)
-
-    if not cart_item:
-        return jsonify({"error": "Cart item not found"}), 404
-
-    # ✅ Restore stock when removing from cart
-    product = next((p for p in products_db if p["id"] == cart_item["productId"]), None)
-    if product:
-        product["stock"] += cart_item["quantity"]
+    """Delete a whole cart"""
+    cart = cart_db.get(cart_id)
 
-    # ✅ Remove the item from the cart
-    cart_db = [item for item in cart_db if item["id"] != cart_id]
+    if not cart:
+        return jsonify({"error": "Cart not found"}), 404
 
-    # ✅ Save updated cart & products to mock database
-    with open("mock_database.json", "w") as file:
-        json.dump({"cart": cart_db, "products": products_db}, file, indent=4)
+    with cart_store.lock(cart["userId"]):
+        cart_store.delete(cart_id)
+        # ✅ Release the cart's reserved units
+        inventory.release(cart_holder(cart["userId"]), [item["productId"] for item in cart["items"]])
 
-    return jsonify({"message": "Item removed from cart"}), 200
+    return jsonify({"message": "Cart removed"}), 200
 
 
 @app.route('/health', methods=['GET'])
@@ -0,0 +1,133 @@
+import threading
+from datetime import datetime
+
+
+class CartStore:
+    """Carts keyed by user, with items keyed by product id.
+
+    Cart records keep their stored shape ({"userId", "items": [...], "totalAmount"}),
+    but every item operation finds its cart through the userId index and its item
+    through a per-cart position map, and totalAmount is adjusted by the change
+    instead of re-summed, so no operation depends on the number of carts or items.
+    `carts` is the cart repository; every operation saves the whole cart record."""
+
+    def __init__(self, carts):
+        self.carts = carts
+        self._positions = {}  # user_id -> {product_id: index in cart["items"]}
+        self._locks = {}  # user_id -> lock serializing that user's cart operations
+        self._lock = threading.Lock()
+        for cart in carts:
+            self._index(cart)
+        carts.subscribe(self.on_change)
+
+    def _index(self, cart):
+        self._positions[cart["userId"]] = {item["productId"]: i for i, item in enumerate(cart["items"])}
+
+    def on_change(self, op, record):
+        """Collection listener re-indexing carts replaced from outside (e.g. by another replica)"""
+        if op == "put":
+            # Positions are checked on use (see _item), so only a cart whose size changed is re-indexed
+            if len(self._positions.get(record["userId"], ())) != len(record["items"]):
+                self._index(record)
+        elif op == "delete":
+            self._positions.pop(record["userId"], None)
+        else:
+            self._positions = {}
+            for cart in self.carts:
+                self._index(cart)
+
+    def lock(self, user_id):
+        """Lock of one user's cart (created on first use)"""
+        with self._lock:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def get(self, user_id):
+        """The user's cart record, or None"""
+        return self.carts.first_by("userId", user_id)
+
+    def get_item(self, user_id, product_id):
+        cart = self.get(user_id)
+        return self._item(cart, product_id) if cart is not None else None
+
+    def _item(self, cart, product_id):
+        positions = self._positions.get(cart["userId"])
+        index = positions.get(product_id) if positions is not None else None
+        if positions is None or len(positions) != len(cart["items"]) or (
+                index is not None and (index >= len(cart["items"]) or cart["items"][index]["productId"] != product_id)):
+            # Positions are stale (cart changed by another process): re-index this cart
+            self._index(cart)
+            index = self._positions[cart["userId"]].get(product_id)
+        return cart["items"][index] if index is not None else None
+
+    def _cart(self, user_id):
+        cart = self.get(user_id)
+        if cart is None:
+            cart = {
+                "id": self.carts.new_id("cart"),
+                "userId": user_id,
+                "items": [],
+                "totalAmount": 0,
+                "createdAt": datetime.utcnow().isoformat() + "Z"
+            }
+            self._index(cart)
+        return cart
+
+    @staticmethod
+    def _add_to_total(cart, amount):
+        # Rounded to cents so repeated float adjustments do not drift
+        cart["totalAmount"] = round(cart["totalAmount"] + amount, 2)
+
+    def _set_quantity(self, cart, product_id, quantity, price):
+        positions = self._positions[cart["userId"]]
+        index = positions.get(product_id)
+        if index is None:
+            if quantity:
+                positions[product_id] = len(cart["items"])
+                cart["items"].append({"productId": product_id, "quantity": quantity, "price": price})
+                self._add_to_total(cart, price * quantity)
+            return
+        item = cart["items"][index]
+        self._add_to_total(cart, item["price"] * (quantity - item["quantity"]))
+        if quantity:
+            item["quantity"] = quantity
+            return
+        # Swap-remove: move the last item into the freed slot
+        last = cart["items"].pop()
+        del positions[product_id]
+        if last is not item:
+            cart["items"][index] = last
+            positions[last["productId"]] = index
+
+    def add_items(self, user_id, items):
+        """Add {product_id: (quantity, price)} to the user's cart (quantities add up) and save it"""
+        cart = self._cart(user_id)
+        for product_id, (quantity, price) in items.items():
+            current = self._item(cart, product_id)
+            self._set_quantity(cart, product_id, quantity + (current["quantity"] if current else 0), price)
+        return self.carts.save(cart)
+
+    def set_quantity(self, user_id, product_id, quantity):
+        """Change an item's quantity (0 removes it) and save the cart; None if the item is missing"""
+        cart = self.get(user_id)
+        item = self._item(cart, product_id) if cart is not None else None
+        if item is None:
+            return None
+        self._set_quantity(cart, product_id, quantity, item["price"])
+        return self.carts.save(cart)
+
+    def remove_item(self, user_id, product_id):
+        return self.set_quantity(user_id, product_id, 0)
+
+    def clear(self, user_id):
+        """Empty the user's cart and save it; returns the removed items"""
+        cart = self.get(user_id)
+        if cart is None:
+            return []
+        items, cart["items"], cart["totalAmount"] = cart["items"], [], 0
+        self._positions[user_id] = {}
+        self.carts.save(cart)
+        return items
+
+    def delete(self, cart_id):
+        """Delete a whole cart record; returns it, or None"""
+        return self.carts.delete(cart_id)
@@ -1,7 +1,6 @@
 from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
-import json
 import sys
 import os
 from config import Config
@@ -43,12 +42,12 @@ category_schema = {
 @filter_and_sort_data  # ✅ Filtering and Sorting
 def get_categories():
     """Retrieve all categories with pagination, filtering, and sorting"""
-    return jsonify(categories_db), 200
+    return categories_db.query(), 200
 
 @app.route('/api/categories/<category_id>', methods=['GET'])
 def get_category_by_id(category_id):
     """Retrieve a single category by ID"""
-    category = next((c for c in categories_db if c["id"] == category_id), None)
+    category = categories_db.get(category_id)
     if category:
         return jsonify(category), 200
     return jsonify({"message": "Category not found"}), 404
@@ -59,14 +58,11 @@ def add_category():
     """Add a new category"""
     data = request.json
     new_category = {
-        "id": f"cat-{len(categories_db) + 1}",
+        "id": categories_db.new_id("cat"),
         "name": data["name"],
         "description": data["description"]
     }
-    categories_db.append(new_category)
-
-    with open("mock_database.json", "w") as file:
-        json.dump({"categories": categories_db}, file, indent=4)
+    categories_db.insert(new_category)
 
     return jsonify(new_category), 201
 
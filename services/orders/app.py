@@ -1,7 +1,7 @@
 from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
-import json
+import jsonschema
 import sys
 import os
 from datetime import datetime
@@ -10,7 +10,8 @@ from config import Config
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
 from utils.database import orders_db, cart_db, users_db, products_db
-from utils.middleware import validate_json, paginate_data, filter_and_sort_data ,handle_errors ,prevent_duplicates,admin_required # Middleware
+from utils.inventory import InsufficientStock, cart_holder, inventory
+from utils.middleware import validate_json, compile_schema, paginate_data, filter_and_sort_data ,handle_errors ,prevent_duplicates,admin_required # Middleware
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -53,51 +54,37 @@ order_schema = {
     "required": ["user_id", "cart_items", "status"]
 }
 
-@app.route('/api/orders', methods=['GET'])
-@paginate_data  # ✅ Apply pagination
-@filter_and_sort_data  # ✅ Apply filtering & sorting
-def get_orders():
-    """Retrieve all orders"""
-    return jsonify(orders_db), 200
-
-@app.route('/api/orders/<order_id>', methods=['GET'])
-def get_order_by_id(order_id):
-    """Retrieve a single order by ID"""
-    order = next((o for o in orders_db if o["id"] == order_id), None)
-    if order:
-        return jsonify(order), 200
-    return jsonify({"error": "Order not found"}), 404
+# ✅ Compiled once, reused for every order of a batch
+order_validator = compile_schema(order_schema)
 
-@app.route('/api/orders', methods=['POST'])
-@validate_json(order_schema)  # ✅ Validate request body
-@prevent_duplicates  # ✅ Prevent Duplicates
-@handle_errors  # ✅ Handle Errors
-  # ✅ Apply Rate Limiting
-def place_order():
-    """Place a new order from the cart"""
-    data = request.json
+# Max orders per batch request
+MAX_BATCH_SIZE = 1000
 
+def build_order(data):
+    """Validate an order against users and carts, reserve its stock and return
+    (order, None), or (None, (error, status)). The user's cart reservation on
+    the same products is taken over by the order."""
     # ✅ Check if user exists
-    user = next((u for u in users_db if u["id"] == data["user_id"]), None)
+    user = users_db.get(data["user_id"])
     if not user:
-        return jsonify({"error": "User not found"}), 404
+        return None, ("User not found", 404)
 
     # ✅ Check if the user's cart exists
-    user_cart = next((cart for cart in cart_db if cart["userId"] == data["user_id"]), None)
+    user_cart = cart_db.first_by("userId", data["user_id"])
     if not user_cart or len(user_cart["items"]) == 0:
-        return jsonify({"error": "Cart is empty"}), 400
+        return None, ("Cart is empty", 400)
 
     # ✅ Calculate total price dynamically & update cart items with product prices
     total_price = 0
     updated_cart_items = []
+    requested = {}
 
     for item in data["cart_items"]:
-        product = next((p for p in products_db if p["id"] == item["product_id"]), None)
+        product = products_db.get(item["product_id"])
         if not product:
-            return jsonify({"error": f"Product with ID {item['product_id']} not found"}), 404
+            return None, (f"Product with ID {item['product_id']} not found", 404)
 
-        if item["quantity"] > product["stock"]:
-            return jsonify({"error": f"Not enough stock available for {product['name']}"}), 400
+        requested[product["id"]] = requested.get(product["id"], 0) + item["quantity"]
 
         # ✅ Store only productId and quantity, but fetch price dynamically
         cart_item = {
@@ -112,7 +99,7 @@ def place_order():
 
     # ✅ Create the order with `createdAt` timestamp
     new_order = {
-        "id": f"order-{len(orders_db) + 1}",
+        "id": orders_db.new_id("order"),
         "user_id": data["user_id"],
         "cart_items": updated_cart_items,  # ✅ Updated with product references
         "total_price": total_price,  # ✅ Automatically calculated
@@ -120,14 +107,83 @@ def place_order():
         "createdAt": datetime.utcnow().isoformat() + "Z"
     }
 
-    orders_db.append(new_order)
+    # ✅ Reserve all products at once until the order is confirmed
+    try:
+        inventory.reserve(new_order["id"], requested, source=cart_holder(data["user_id"]))
+    except InsufficientStock as e:
+        return None, (f"Not enough stock available for {products_db.get(e.product_id)['name']}", 400)
+    return new_order, None
 
-    # ✅ Save order to mock database
-    with open("mock_database.json", "w") as file:
-        json.dump({"orders": orders_db}, file, indent=4)
+@app.route('/api/orders', methods=['GET'])
+@paginate_data  # ✅ Apply pagination
+@filter_and_sort_data  # ✅ Apply filtering & sorting
+def get_orders():
+    """Retrieve all orders"""
+    return orders_db.query(), 200
+
+@app.route('/api/orders/<order_id>', methods=['GET'])
+def get_order_by_id(order_id):
+    """Retrieve a single order by ID"""
+    order = orders_db.get(order_id)
+    if order:
+        return jsonify(order), 200
+    return jsonify({"error": "Order not found"}), 404
+
+@app.route('/api/orders', methods=['POST'])
+@validate_json(order_schema)  # ✅ Validate request body
+@prevent_duplicates  # ✅ Prevent Duplicates
+@handle_errors  # ✅ Handle Errors
+  # ✅ Apply Rate Limiting
+def place_order():
+    """Place a new order from the cart"""
+    data = request.json
+
+    new_order, error = build_order(data)
+    if error:
+        message, status = error
+        return jsonify({"error": message}), status
+
+    # ✅ Save order to the database, on disk before it is confirmed to the client
+    orders_db.insert(new_order)
+    orders_db.barrier()
 
     return jsonify(new_order), 201
 
+@app.route('/api/orders/batch', methods=['POST'])
+@handle_errors  # ✅ Handle Errors
+def place_orders_batch():
+    """Place many orders at once; each one succeeds or fails on its own"""
+    data = request.get_json(silent=True)
+    orders = data.get("orders") if isinstance(data, dict) else None
+    if not isinstance(orders, list) or not orders:
+        return jsonify({"error": "orders must be a non-empty array"}), 400
+    if len(orders) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} orders per batch"}), 400
+
+    # ✅ One pass: each order reserves its stock, so later orders see what earlier ones took
+    results = []
+    created = []
+    for index, order_data in enumerate(orders):
+        error = jsonschema.exceptions.best_match(order_validator.iter_errors(order_data))
+        if error is not None:
+            results.append({"index": index, "status": 400, "error": "Invalid request data", "message": error.message})
+            continue
+
+        new_order, error = build_order(order_data)
+        if error:
+            message, status = error
+            results.append({"index": index, "status": status, "error": message})
+            continue
+
+        created.append(new_order)
+        results.append({"index": index, "status": 201, "order": new_order})
+
+    # ✅ The whole batch is persisted with a single durable write
+    orders_db.insert_many(created)
+
+    status = 201 if len(created) == len(orders) else 207 if created else 400
+    return jsonify({"created": len(created), "failed": len(orders) - len(created), "results": results}), status
+
 @app.route('/api/orders/<order_id>', methods=['PUT'])
 @admin_required  # ✅ Only Admins Can Update Orders
 @handle_errors  # ✅ Handle Errors
@@ -135,10 +191,6 @@ def place_order():
 def update_order_status(order_id):
     """Update order status"""
     data = request.json
-    order = next((o for o in orders_db if o["id"] == order_id), None)
-
-    if not order:
-        return jsonify({"error": "Order not found"}), 404
 
     valid_transitions = {
         "pending": ["confirmed"],
@@ -147,27 +199,32 @@ def update_order_status(order_id):
         "delivered": []  # No further status updates allowed
     }
 
-    current_status = order["status"]
-    new_status = data.get("status")
+    def transition():
+        # ✅ Check and update in one atomic step: two concurrent confirmations can't both take the stock
+        order = orders_db.get(order_id)
+        if not order:
+            return jsonify({"error": "Order not found"}), 404
+
+        current_status = order["status"]
+        new_status = data.get("status")
 
-    if new_status not in valid_transitions[current_status]:
-        return jsonify({"error": f"Invalid status transition from {current_status} to {new_status}"}), 400
+        if new_status not in valid_transitions[current_status]:
+            return jsonify({"error": f"Invalid status transition from {current_status} to {new_status}"}), 400
 
-    # ✅ Update order status
-    order["status"] = new_status
+        # ✅ If confirmed, the order's units leave the stock and its reservation is released
+        if new_status == "confirmed":
+            sold = {}
+            for item in order["cart_items"]:
+                sold[item["productId"]] = sold.get(item["productId"], 0) + item["quantity"]
+            inventory.commit(order_id, sold)
 
-    # ✅ If confirmed, update inventory in `products_db`
-    if new_status == "confirmed":
-        for item in order["cart_items"]:
-            product = next((p for p in products_db if p["id"] == item["productId"]), None)
-            if product:
-                product["stock"] -= item["quantity"]
+        # ✅ Update order status (on disk before answering, with the stock change)
+        return jsonify(orders_db.update(order_id, {"status": new_status})), 200
 
-    # ✅ Save changes
-    with open("mock_database.json", "w") as file:
-        json.dump({"orders": orders_db, "products": products_db}, file, indent=4)
+    response = orders_db.atomic(transition)
+    orders_db.barrier()
 
-    return jsonify(order), 200
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -13,4 +13,3 @@ class Config:
     FLASK_RUN_PORT = int(os.getenv("FLASK_RUN_PORT", 5000))
     API_PORT = int(os.getenv("API_PORT", 5000))
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "mahdi")
-    MOCK_DB_PATH = os.getenv("MOCK_DB_PATH", "../mock_database.json")
@@ -1,7 +1,6 @@
 from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
-import json
 import sys
 import os
 from datetime import datetime
@@ -10,6 +9,7 @@ from config import Config
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
 from utils.database import pets_db, products_db, categories_db
 from utils.middleware import validate_json, paginate_data, filter_and_sort_data  # Middleware
+from recommendations import MAX_RECOMMENDATIONS, RecommendationIndex
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -30,6 +30,13 @@ def get_openapi_yaml():
     """Serve OpenAPI YAML file"""
     return send_from_directory(os.path.dirname(os.path.abspath(__file__)), "openapi.yaml", mimetype="text/yaml")
 
+# ✅ species -> food products index, refreshed when the catalog or pets change
+recommendation_index = RecommendationIndex(products_db, categories_db)
+recommendation_index.build()
+products_db.subscribe(recommendation_index.on_catalog_change)
+categories_db.subscribe(recommendation_index.on_catalog_change)
+pets_db.subscribe(recommendation_index.on_pet_change)
+
 # ✅ Pet schema validation
 pet_schema = {
     "type": "object",
@@ -52,15 +59,14 @@ def get_pets():
     """
     owner_id = request.args.get("owner_id")
     if owner_id:
-        user_pets = [p for p in pets_db if p["owner_id"] == owner_id]
-        return jsonify(user_pets), 200
+        return pets_db.query(owner_id=owner_id), 200
 
-    return jsonify(pets_db), 200
+    return pets_db.query(), 200
 
 @app.route('/api/pets/<pet_id>', methods=['GET'])
 def get_pet_by_id(pet_id):
     """Retrieve a single pet by ID"""
-    pet = next((p for p in pets_db if p["id"] == pet_id), None)
+    pet = pets_db.get(pet_id)
     if pet:
         return jsonify(pet), 200
     return jsonify({"error": "Pet not found"}), 404
@@ -71,7 +77,7 @@ def add_pet():
     """Add a new pet"""
     data = request.json
     new_pet = {
-        "id": f"pet-{len(pets_db) + 1}",
+        "id": pets_db.new_id("pet"),
         "name": data["name"],
         "species": data["species"],
         "breed": data["breed"],
@@ -80,31 +86,15 @@ def add_pet():
         "createdAt": datetime.utcnow().isoformat()  # ✅ Add timestamp
     }
     
-    pets_db.append(new_pet)
-
-    # ✅ Save pet to mock database
-    with open("mock_database.json", "r") as file:
-        db_data = json.load(file)
-    db_data["pets"] = pets_db  # Update pets list
-
-    with open("mock_database.json", "w") as file:
-        json.dump(db_data, file, indent=4)
+    # ✅ Save pet to the database
+    pets_db.insert(new_pet)
 
     return jsonify(new_pet), 201
 
 @app.route('/api/pets/<pet_id>', methods=['DELETE'])
 def delete_pet(pet_id):
     """Delete a pet"""
-    global pets_db
-    pets_db = [p for p in pets_db if p["id"] != pet_id]
-
-    # ✅ Save updated list
-    with open("mock_database.json", "r") as file:
-        db_data = json.load(file)
-    db_data["pets"] = pets_db
-
-    with open("mock_database.json", "w") as file:
-        json.dump(db_data, file, indent=4)
+    pets_db.delete(pet_id)
 
     return jsonify({"message": "Pet deleted successfully"}), 200
 
@@ -118,24 +108,15 @@ def get_user_recommendations():
     if not owner_id:
         return jsonify({"error": "Owner ID is required"}), 400
     
-    user_pets = [p for p in pets_db if p["owner_id"] == owner_id]
+    user_pets = pets_db.find_by("owner_id", owner_id)
     
     if not user_pets:
         return jsonify({"error": "No pets found for this user"}), 404
 
-    recommended_products = []
-    
-    for pet in user_pets:
-        # Find products related to pet's species
-        pet_products = [p for p in products_db if pet["species"].lower() == p["animalType"].lower()]
-
-        # Filter products to show only **food** category
-        food_category_id = next((c["id"] for c in categories_db if "aliment" in c["name"].lower()), None)
-
-        if food_category_id:
-            pet_products = [p for p in pet_products if p["category"] == food_category_id]
+    limit = max(1, min(int(request.args.get("limit", 10)), MAX_RECOMMENDATIONS))
 
-        recommended_products.extend(pet_products)
+    # ✅ Ranked, deduplicated food products for the user's pets, cached per owner
+    recommended_products = recommendation_index.recommend(owner_id, user_pets, limit)
 
     return jsonify({
         "owner_id": owner_id,
@@ -0,0 +1,85 @@
+import threading
+
+# Most products kept per species, and so the largest `limit` a request can ask for
+MAX_RECOMMENDATIONS = 50
+
+
+def rank(product):
+    """In-stock products first, then cheapest, then best stocked"""
+    return (product.get("stock", 0) <= 0, product.get("price", 0), -product.get("stock", 0), product["id"])
+
+
+class RecommendationIndex:
+    """species -> ranked food products, plus a per-owner cache of recommendations.
+
+    The index is rebuilt lazily after products or categories change; a pet
+    change only drops its owner's cached recommendations."""
+
+    def __init__(self, products, categories):
+        self.products = products
+        self.categories = categories
+        self._by_species = {}
+        self._cache = {}  # owner_id -> {limit: recommended products}
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Group food products by the species they are for, best ranked first"""
+        # Only the **food** category is recommended, when the catalog has one
+        food_category_ids = {c["id"] for c in self.categories if "aliment" in c["name"].lower()}
+        by_species = {}
+        for product in self.products:
+            if food_category_ids and product.get("category") not in food_category_ids:
+                continue
+            species = str(product.get("animalType", "")).lower()
+            if species:
+                by_species.setdefault(species, []).append(product)
+        self._by_species = {
+            species: sorted(products, key=rank)[:MAX_RECOMMENDATIONS]
+            for species, products in by_species.items()
+        }
+        self._cache = {}
+        self._dirty = False
+
+    def recommend(self, owner_id, pets, limit):
+        """Ranked food products for the species of an owner's pets, one entry per product"""
+        with self._lock:
+            if self._dirty:
+                self.build()
+            cached = self._cache.get(owner_id, {}).get(limit)
+            if cached is not None:
+                return cached
+
+            # Pets of the same species share one list; species take turns so each gets a share
+            species_lists = [self._by_species.get(s, []) for s in dict.fromkeys(p["species"].lower() for p in pets)]
+            recommended, seen = [], set()
+            for rank_index in range(MAX_RECOMMENDATIONS):
+                if len(recommended) >= limit:
+                    break
+                exhausted = True
+                for products in species_lists:
+                    if rank_index < len(products):
+                        exhausted = False
+                        product = products[rank_index]
+                        if product["id"] not in seen and len(recommended) < limit:
+                            seen.add(product["id"])
+                            recommended.append(product)
+                if exhausted:
+                    break
+
+            self._cache.setdefault(owner_id, {})[limit] = recommended
+            return recommended
+
+    def on_catalog_change(self, op, record):
+        """Collection listener for products and categories: rebuild on next use"""
+        with self._lock:
+            self._dirty = True
+            self._cache = {}
+
+    def on_pet_change(self, op, record):
+        """Collection listener for pets: forget the owner's cached recommendations"""
+        with self._lock:
+            if record is None:
+                self._cache = {}
+            else:
+                self._cache.pop(record.get("owner_id"), None)
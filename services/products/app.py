@@ -1,7 +1,6 @@
 from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
-import json
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
@@ -45,12 +44,12 @@ def get_openapi_yaml():
 @filter_and_sort_data
 def get_products():
     """Retrieve all products"""
-    return jsonify(products_db), 200
+    return products_db.query(), 200
 
 @app.route('/api/products/<product_id>', methods=['GET'])
 def get_product_by_id(product_id):
     """Retrieve a single product by ID"""
-    product = next((p for p in products_db if p["id"] == product_id), None)
+    product = products_db.get(product_id)
     if product:
         return jsonify(product), 200
     return jsonify({"message": "Product not found"}), 404
@@ -64,17 +63,14 @@ def add_product():
     """Add a new product"""
     data = request.json
     new_product = {
-        "id": f"prod-{len(products_db) + 1}",
+        "id": products_db.new_id("prod"),
         "name": data["name"],
         "description": data["description"],
         "price": data["price"],
         "category": data["category"],
         "stock": data["stock"]
     }
-    products_db.append(new_product)
-
-    with open("mock_database.json", "w") as file:
-        json.dump({"products": products_db}, file, indent=4)
+    products_db.insert(new_product)
 
     return jsonify(new_product), 201
 
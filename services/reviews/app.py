@@ -1,7 +1,6 @@
 from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
-import json
 import sys
 import os
 import datetime
@@ -9,7 +8,8 @@ from config import Config
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
 from utils.database import reviews_db, products_db, users_db
-from utils.middleware import validate_json, paginate_data, filter_and_sort_data ,handle_errors ,prevent_duplicates,admin_required # Middleware
+from utils.middleware import validate_json, paginate_data, filter_and_sort_data ,handle_errors # Middleware
+from ratings import RatingAggregates
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -30,6 +30,14 @@ def get_openapi_yaml():
     """Serve OpenAPI YAML file"""
     return send_from_directory(os.path.dirname(os.path.abspath(__file__)), "openapi.yaml", mimetype="text/yaml")
 
+# ✅ Per-product rating aggregates built at startup, kept in sync with reviews
+rating_aggregates = RatingAggregates(reviews_db)
+rating_aggregates.build()
+reviews_db.subscribe(rating_aggregates.on_change)
+
+# Max products per bulk ratings request
+MAX_RATINGS_BATCH = 100
+
 # ✅ Review schema validation
 review_schema = {
     "type": "object",
@@ -47,12 +55,30 @@ review_schema = {
 @filter_and_sort_data  # ✅ Apply filtering & sorting
 def get_reviews():
     """Retrieve all reviews"""
-    return jsonify(reviews_db), 200
+    return reviews_db.query(), 200
+
+@app.route('/api/reviews/ratings', methods=['GET'])
+def get_ratings():
+    """Rating summaries of several products (?product_ids=prod-001,prod-002)"""
+    product_ids = [p for p in request.args.get("product_ids", "").split(",") if p]
+    if not product_ids:
+        return jsonify({"error": "product_ids is required"}), 400
+    if len(product_ids) > MAX_RATINGS_BATCH:
+        return jsonify({"error": f"At most {MAX_RATINGS_BATCH} product_ids per request"}), 400
+    return jsonify(rating_aggregates.get_many(dict.fromkeys(product_ids))), 200
+
+@app.route('/api/reviews/ratings/<product_id>', methods=['GET'])
+def get_rating(product_id):
+    """Rating summary of a product: count, sum, average, 1-5 histogram, last review time"""
+    rating = rating_aggregates.get(product_id)
+    if rating["count"] == 0 and products_db.get(product_id) is None:
+        return jsonify({"error": "Product not found"}), 404
+    return jsonify(rating), 200
 
 @app.route('/api/reviews/<review_id>', methods=['GET'])
 def get_review_by_id(review_id):
     """Retrieve a single review by ID"""
-    review = next((r for r in reviews_db if r["id"] == review_id), None)
+    review = reviews_db.get(review_id)
     if review:
         return jsonify(review), 200
     return jsonify({"error": "Review not found"}), 404
@@ -62,20 +88,18 @@ def get_review_by_id(review_id):
 @filter_and_sort_data
 def get_reviews_by_product(product_id):
     """Retrieve reviews for a specific product"""
-    product_reviews = [r for r in reviews_db if r["product_id"] == product_id]
-    return jsonify(product_reviews), 200
+    return reviews_db.query(product_id=product_id), 200
 
 @app.route('/api/reviews', methods=['POST'])
 @validate_json(review_schema)  # ✅ Validate request body
-@prevent_duplicates  # ✅ Prevent Duplicates
 @handle_errors  # ✅ Handle Errors
   # ✅ Apply Rate Limiting
 def add_review():
     """Add a review for a product"""
     data = request.json
 
-    user = next((u for u in users_db if u["id"] == data["user_id"]), None)
-    product = next((p for p in products_db if p["id"] == data["product_id"]), None)
+    user = users_db.get(data["user_id"])
+    product = products_db.get(data["product_id"])
 
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -84,7 +108,7 @@ def add_review():
 
     # ✅ Create review with `createdAt` timestamp
     new_review = {
-        "id": f"review-{len(reviews_db) + 1}",
+        "id": reviews_db.new_id("review"),
         "user_id": data["user_id"],
         "product_id": data["product_id"],
         "rating": data["rating"],
@@ -92,11 +116,8 @@ def add_review():
         "createdAt": datetime.datetime.utcnow().isoformat()  # ✅ Added review timestamp
     }
     
-    reviews_db.append(new_review)
-
-    # ✅ Save review to mock database
-    with open("mock_database.json", "w") as file:
-        json.dump({"reviews": reviews_db}, file, indent=4)
+    # ✅ Save review to the database
+    reviews_db.insert(new_review)
 
     return jsonify(new_review), 201
 
@@ -0,0 +1,104 @@
+import threading
+
+RATINGS = (1, 2, 3, 4, 5)
+
+
+def review_product_id(review):
+    """Product a review belongs to (the seed data's `productId` is renamed on load, see
+    database.FIELD_ALIASES, so the ratings count the reviews the listing returns)"""
+    return review.get("product_id")
+
+
+class RatingAggregates:
+    """Per-product rating count, sum, 1-5 histogram and last review time,
+    kept in sync with reviews_db so a product's rating is an O(1) lookup."""
+
+    def __init__(self, reviews):
+        self.reviews = reviews
+        self._products = {}  # product_id -> aggregate
+        self._contributions = {}  # review_id -> (product_id, rating), so a review can be subtracted
+        self._lock = threading.Lock()
+
+    def build(self):
+        """(Re)compute every aggregate from the reviews collection"""
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        self._products = {}
+        self._contributions = {}
+        for review in self.reviews:
+            self._add(review)
+
+    def _aggregate(self, product_id):
+        aggregate = self._products.get(product_id)
+        if aggregate is None:
+            aggregate = self._products[product_id] = {
+                "count": 0, "sum": 0, "histogram": dict.fromkeys(RATINGS, 0), "lastReviewAt": None,
+            }
+        return aggregate
+
+    def _add(self, review):
+        product_id, rating = review_product_id(review), review.get("rating")
+        if product_id is None or rating not in RATINGS:
+            return
+        aggregate = self._aggregate(product_id)
+        aggregate["count"] += 1
+        aggregate["sum"] += rating
+        aggregate["histogram"][rating] += 1
+        created_at = review.get("createdAt")
+        if created_at and (aggregate["lastReviewAt"] is None or created_at > aggregate["lastReviewAt"]):
+            aggregate["lastReviewAt"] = created_at
+        self._contributions[review["id"]] = (product_id, rating)
+
+    def _remove(self, review_id, rescan=True):
+        contribution = self._contributions.pop(review_id, None)
+        if contribution is None:
+            return
+        product_id, rating = contribution
+        aggregate = self._products[product_id]
+        aggregate["count"] -= 1
+        aggregate["sum"] -= rating
+        aggregate["histogram"][rating] -= 1
+        if aggregate["count"] == 0:
+            del self._products[product_id]
+        elif rescan:
+            # Only a removal can move the last review time back: rescan this product's reviews
+            aggregate["lastReviewAt"] = max(
+                (r["createdAt"] for r in self.reviews
+                 if review_product_id(r) == product_id and r["id"] != review_id and r.get("createdAt")),
+                default=None,
+            )
+
+    def get(self, product_id):
+        """Rating summary of one product (zero counts when it has no reviews)"""
+        with self._lock:
+            aggregate = self._products.get(product_id)
+            if aggregate is None:
+                return {
+                    "product_id": product_id, "count": 0, "sum": 0, "average": None,
+                    "histogram": {str(r): 0 for r in RATINGS}, "lastReviewAt": None,
+                }
+            return {
+                "product_id": product_id,
+                "count": aggregate["count"],
+                "sum": aggregate["sum"],
+                "average": round(aggregate["sum"] / aggregate["count"], 2),
+                "histogram": {str(r): n for r, n in aggregate["histogram"].items()},
+                "lastReviewAt": aggregate["lastReviewAt"],
+            }
+
+    def get_many(self, product_ids):
+        return [self.get(product_id) for product_id in product_ids]
+
+    def on_change(self, op, record):
+        """Collection listener keeping the aggregates in sync with reviews_db"""
+        with self._lock:
+            if op == "put":
+                # A re-put review (edited rating) replaces its previous contribution
+                self._remove(record["id"], rescan=False)
+                self._add(record)
+            elif op == "delete":
+                self._remove(record["id"])
+            else:
+                self._rebuild()
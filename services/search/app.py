@@ -1,7 +1,6 @@
 from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
-import json
 import sys
 import os
 from config import Config
@@ -9,6 +8,8 @@ from config import Config
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
 from utils.database import products_db, categories_db
 from utils.middleware import paginate_data, filter_and_sort_data  # Import middleware
+from utils.query import Query
+from search_index import SearchIndex, tokenize
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -29,22 +30,51 @@ def get_openapi_yaml():
     """Serve OpenAPI YAML file"""
     return send_from_directory(os.path.dirname(os.path.abspath(__file__)), "openapi.yaml", mimetype="text/yaml")
 
+# ✅ Inverted index built at startup, kept in sync with products and categories
+search_index = SearchIndex(products_db, categories_db)
+search_index.build()
+products_db.subscribe(search_index.on_change)
+categories_db.subscribe(search_index.on_category_change)
+
 @app.route('/api/search', methods=['GET'])
-@paginate_data  # ✅ Apply pagination
-@filter_and_sort_data  # ✅ Apply sorting
 def search_products():
     """
-    Search for products by keyword (q) and category
+    Search for products by keyword (q) and category, ranked by relevance
     """
-    query = request.args.get("q", "").lower()
+    query = request.args.get("q", "")
+
+    # ✅ Explicit sorting/filtering or an empty query keep the unranked listing
+    if not tokenize(query) or request.args.get("sort_by") or request.args.get("filter_key"):
+        return list_matches(query)
+
+    page = int(request.args.get("page", 1))
+    limit = int(request.args.get("limit", 10))
+    start = (page - 1) * limit
+
+    # ✅ Only the top page * limit products are selected and serialized
+    total, top = search_index.search(query, page * limit)
+    # ✅ A product deleted since the index last heard of it is skipped
+    scores = dict(top[start:])
+    results = [dict(product, score=round(scores[product["id"]], 4)) for product in products_db.get_many(scores)]
+
+    return jsonify({
+        "page": page,
+        "limit": limit,
+        "total": total,
+        "results": results
+    }), 200
+
+@paginate_data  # ✅ Apply pagination
+@filter_and_sort_data  # ✅ Apply sorting
+def list_matches(query):
+    """All products matching the query, in catalog order"""
+    if not tokenize(query):
+        return products_db.query(), 200
 
-    # Filter products by name or category match
-    results = [
-        product for product in products_db
-        if query in product["name"].lower() or query in product["category"].lower()
-    ]
+    _, matches = search_index.search(query, None)
+    results = products_db.get_many(product_id for product_id, _ in matches)
 
-    return jsonify(results), 200
+    return Query(results), 200
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -0,0 +1,242 @@
+import bisect
+import heapq
+import math
+import operator
+import re
+import threading
+import unicodedata
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Product fields that are tokenized into the index
+FIELDS = ("name", "description", "category")
+
+# BM25 parameters and per-field weights (name hits are boosted, category only filters)
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {"name": 2.0, "description": 1.0}
+
+# The last query word matches as a prefix only from this length on (shorter, as a whole word),
+# and expands to at most this many tokens, the most frequent ones
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 50
+
+
+def normalize(text):
+    """Lowercase and strip accents so "Litière" and "litiere" match"""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    """Split text into accent-folded word tokens"""
+    return _TOKEN_RE.findall(normalize(text))
+
+
+class SearchIndex:
+    """Inverted index over the product catalog: token -> {product_id: BM25 term weight}.
+
+    The weights are BM25 without the idf (which changes with every document) and are
+    computed at index time, with the average field lengths of the last build(). Each
+    posting list also has an impact-ordered copy, so search() can stop as soon as no
+    unseen product can enter the top k."""
+
+    def __init__(self, products, categories=None):
+        self.products = products
+        self.categories = categories
+        self._postings = {}
+        self._impacts = {}  # token -> [(weight, product_id)] highest first, built on demand
+        self._vocabulary = []  # Sorted tokens, for prefix matching of the last query word
+        self._doc_tokens = {}  # product_id -> tokens, so a product can be unindexed
+        self._averages = dict.fromkeys(FIELD_WEIGHTS, 1)  # field -> average token count
+        self._lock = threading.Lock()
+
+    def _fields(self, product):
+        fields = {field: product.get(field) or "" for field in FIELDS}
+        # Index the category name as well as its id
+        category = self.categories.get(product.get("category")) if self.categories is not None else None
+        if category:
+            fields["category"] = f"{fields['category']} {category.get('name', '')}"
+        return {field: tokenize(text) for field, text in fields.items()}
+
+    def _add(self, product_id, fields):
+        counts = {}  # token -> {field: term frequency}
+        for field, words in fields.items():
+            for token in words:
+                tf = counts.setdefault(token, {})
+                tf[field] = tf.get(field, 0) + 1
+        for token, tf in counts.items():
+            weight = 0.0
+            for field, field_weight in FIELD_WEIGHTS.items():
+                if field in tf:
+                    norm = 1 - BM25_B + BM25_B * len(fields[field]) / self._averages[field]
+                    weight += field_weight * tf[field] * (BM25_K1 + 1) / (tf[field] + BM25_K1 * norm)
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            posting[product_id] = weight
+            self._impacts.pop(token, None)
+        self._doc_tokens[product_id] = tuple(counts)
+
+    def _remove(self, product_id):
+        for token in self._doc_tokens.pop(product_id, ()):
+            posting = self._postings[token]
+            posting.pop(product_id, None)
+            self._impacts.pop(token, None)
+            if not posting:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+
+    def build(self):
+        """(Re)build the whole index from the catalog"""
+        with self._lock:
+            self._postings, self._impacts, self._vocabulary, self._doc_tokens = {}, {}, [], {}
+            documents = [(product["id"], self._fields(product)) for product in self.products]
+            for field in FIELD_WEIGHTS:
+                total = sum(len(fields[field]) for _, fields in documents)
+                self._averages[field] = (total / len(documents) if documents else 0) or 1
+            for product_id, fields in documents:
+                self._add(product_id, fields)
+
+    def add(self, product):
+        """Index a new or updated product"""
+        fields = self._fields(product)
+        with self._lock:
+            self._remove(product["id"])
+            self._add(product["id"], fields)
+
+    def remove(self, product_id):
+        """Drop a product from the index"""
+        with self._lock:
+            self._remove(product_id)
+
+    def _prefix_tokens(self, prefix):
+        # The tokens `prefix` expands to: itself if it is too short to expand, otherwise
+        # the MAX_PREFIX_EXPANSIONS most frequent indexed tokens starting with it
+        if len(prefix) < MIN_PREFIX_LENGTH:
+            return [prefix] if prefix in self._postings else []
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + "\U0010ffff", start)
+        tokens = self._vocabulary[start:end]
+        if len(tokens) > MAX_PREFIX_EXPANSIONS:
+            tokens = heapq.nlargest(MAX_PREFIX_EXPANSIONS, tokens, key=lambda token: len(self._postings[token]))
+        return tokens
+
+    def _terms(self, words):
+        # Query terms as lists of tokens: one per word, the last word's prefix expansions
+        terms = [[word] if word in self._postings else [] for word in words[:-1]]
+        terms.append(self._prefix_tokens(words[-1]))
+        return terms
+
+    def _match(self, terms):
+        # (ids of the products containing every term, the smallest term's postings);
+        # the set operations run on dict key views
+        postings = sorted((self._postings[tokens[0]] if len(tokens) == 1 else
+                           {product_id: None for token in tokens for product_id in self._postings[token]}
+                           for tokens in terms), key=len)
+        matched = postings[0].keys()
+        for posting in postings[1:]:
+            matched = matched & posting.keys()
+        return matched, postings[0]
+
+    def _idf(self, token):
+        documents, frequency = len(self._doc_tokens), len(self._postings[token])
+        return math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+
+    def _impact(self, token):
+        # [(weight, product_id)] of the token's postings, highest first
+        impact = self._impacts.get(token)
+        if impact is None:
+            impact = self._impacts[token] = sorted(
+                ((weight, product_id) for product_id, weight in self._postings[token].items()), reverse=True
+            )
+        return impact
+
+    def _scored_impact(self, token, idf):
+        for weight, product_id in self._impact(token):
+            yield idf * weight, product_id
+
+    def _top(self, terms, matched, k):
+        # Threshold algorithm: walk the terms' impact-ordered postings round-robin,
+        # score every product seen with direct lookups in the other terms, and stop
+        # once the k-th best score reaches the sum of the last scores seen per term,
+        # the most an unseen product can still get. Products outside `matched` lack
+        # a term and are skipped without lookups.
+        scorers, cursors, scales = [], [], []
+        for tokens in terms:
+            scorer = [(self._idf(token), self._postings[token]) for token in tokens]
+            scorers.append(scorer)
+            if len(scorer) == 1:
+                cursors.append(iter(self._impact(tokens[0])))
+                scales.append(scorer[0][0])
+            else:
+                # A prefix term scores with the best of the tokens it expands to
+                cursors.append(heapq.merge(*[self._scored_impact(token, idf)
+                                             for token, (idf, _) in zip(tokens, scorer)], reverse=True))
+                scales.append(1.0)
+        bounds = [0.0] * len(cursors)
+        top, seen = [], set()
+        while True:
+            for i, cursor in enumerate(cursors):
+                entry = next(cursor, None)
+                if entry is None:
+                    # Every match holds every term, so all of them have been seen
+                    return sorted(top, reverse=True)
+                weight, product_id = entry
+                bounds[i] = weight
+                if product_id in seen or product_id not in matched:
+                    continue
+                seen.add(product_id)
+                score = scales[i] * weight
+                for j, scorer in enumerate(scorers):
+                    if j == i:
+                        continue
+                    if len(scorer) == 1:
+                        idf, posting = scorer[0]
+                        weight = posting.get(product_id)
+                        if weight is None:
+                            break
+                        score += idf * weight
+                    else:
+                        best = max((idf * posting[product_id] for idf, posting in scorer if product_id in posting),
+                                   default=None)
+                        if best is None:
+                            break
+                        score += best
+                else:
+                    if len(top) < k:
+                        heapq.heappush(top, (score, product_id))
+                    elif (score, product_id) > top[0]:
+                        heapq.heapreplace(top, (score, product_id))
+            if len(top) == k and top[0][0] >= sum(map(operator.mul, scales, bounds)):
+                return sorted(top, reverse=True)
+
+    def search(self, query, k):
+        """Return (total matches, top `k` [(product_id, score)]) ranked by BM25.
+        With k=None every match is returned unranked, in catalog order."""
+        words = tokenize(query)
+        if not words:
+            return 0, []
+        with self._lock:
+            terms = self._terms(words)
+            if not all(terms):
+                return 0, []
+            matched, smallest = self._match(terms)
+            if k is None:
+                return len(matched), [(product_id, 0.0) for product_id in smallest if product_id in matched]
+            top = self._top(terms, matched, k) if k > 0 else []
+        return len(matched), [(product_id, score) for score, product_id in top]
+
+    def on_change(self, op, record):
+        """Collection listener keeping the index in sync with products_db"""
+        if op == "put":
+            self.add(record)
+        elif op == "delete":
+            self.remove(record["id"])
+        else:
+            self.build()
+
+    def on_category_change(self, op, record):
+        """Collection listener re-indexing products when category names change"""
+        self.build()
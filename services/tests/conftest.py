@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+from utils import database
+from utils.database import DataFiles
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """A data directory with one product and no pets; logs go to a temporary directory too"""
+    monkeypatch.setattr(database, "log_dir", str(tmp_path / "wal"))
+    data = DataFiles(str(tmp_path / "data"), snapshots=False)
+    data.write("products", [{"id": "prod-001", "name": "Collar de Cuero Premium", "price": 29.99, "stock": 50}])
+    data.write("pets", [])
+    return data.data_dir
@@ -0,0 +1,96 @@
+import os
+import signal
+import subprocess
+import sys
+
+from utils import database
+from utils.database import LogStore
+from utils.repository import MemoryRepository
+
+# A process that writes, waits for the barrier, reports it and then hangs until killed.
+# The flusher never runs on its own (long interval, no threshold), so only barrier() gets
+# the writes to disk.
+WRITER = """
+import sys, time
+sys.path.append(sys.argv[1])
+from utils.database import LogStore
+from utils.repository import MemoryRepository
+
+pets = MemoryRepository("pets", LogStore(sys.argv[2], sys.argv[3], flush_interval=3600, flush_threshold=10 ** 9))
+for name in ("a", "b", "c"):
+    pets.insert({"id": pets.new_id("pet"), "name": name})
+pets.delete("pet-2")
+pets.update("pet-3", {"name": "c2"})
+pets.barrier()
+print("durable", flush=True)
+time.sleep(3600)
+"""
+
+
+def test_barrier_survives_kill(data_dir):
+    services = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+    writer = subprocess.Popen([sys.executable, "-c", WRITER, services, data_dir, database.log_dir],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        assert writer.stdout.readline().strip() == "durable"
+    finally:
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+    assert writer.returncode == -signal.SIGKILL
+
+    pets = MemoryRepository("pets", LogStore(data_dir, database.log_dir))
+    assert {pet["id"]: pet["name"] for pet in pets} == {"pet-1": "a", "pet-3": "c2"}
+
+
+# Like WRITER, on products, and in two steps: each line read from stdin inserts one more
+# product and reports it durable, so the test can compact in between
+STEP_WRITER = """
+import sys
+sys.path.append(sys.argv[1])
+from utils.database import LogStore
+from utils.repository import MemoryRepository
+
+products = MemoryRepository("products", LogStore(sys.argv[2], sys.argv[3], flush_interval=3600, flush_threshold=10 ** 9))
+for line in sys.stdin:
+    products.insert({"id": line.strip(), "name": line.strip()})
+    products.barrier()
+    print("durable", flush=True)
+"""
+
+
+def test_barrier_survives_other_process_compaction(data_dir):
+    services = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+    writer = subprocess.Popen([sys.executable, "-c", STEP_WRITER, services, data_dir, database.log_dir],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    compactor = LogStore(data_dir, database.log_dir)
+    try:
+        for product_id in ("prod-2", "prod-3"):
+            writer.stdin.write(product_id + "\n")
+            writer.stdin.flush()
+            assert writer.stdout.readline().strip() == "durable"
+            # This process rotates and folds the log the writer has open
+            compactor.compact()
+    finally:
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+
+    assert not os.path.exists(os.path.join(database.log_dir, "products.log.compacting"))
+    products = MemoryRepository("products", LogStore(data_dir, database.log_dir))
+    assert sorted(product["id"] for product in products) == ["prod-001", "prod-2", "prod-3"]
+
+
+def test_compaction_keeps_other_writers_entries(data_dir):
+    # Two processes' stores on one log directory; `a` compacts while `b` has its log open
+    a = MemoryRepository("products", LogStore(data_dir, database.log_dir))
+    b = MemoryRepository("products", LogStore(data_dir, database.log_dir))
+    a.insert({"id": "prod-2", "name": "Arena"})
+    a.barrier()
+    b.insert({"id": "prod-3", "name": "Correa"})
+    b.barrier()
+
+    a.store.compact()
+    b.insert({"id": "prod-4", "name": "Cepillo"})
+    b.barrier()
+
+    products = MemoryRepository("products", LogStore(data_dir, database.log_dir))
+    assert sorted(product["id"] for product in products) == ["prod-001", "prod-2", "prod-3", "prod-4"]
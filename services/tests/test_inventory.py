@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+
+from utils import database
+from utils.database import LogStore, SharedStore
+from utils.inventory import InsufficientStock, Inventory, SharedInventory
+from utils.repository import MemoryRepository, SQLiteDatabase
+
+
+def open_replica(tmp_path, data_dir):
+    # One process of the node: its own connection, store and inventory on the shared file
+    store = SharedStore(SQLiteDatabase(str(tmp_path / "shared.db")), data_dir, sync_interval=0)
+    store.open()
+    products = MemoryRepository("products", store)
+    return products, SharedInventory(products, store.database, refresh=store.sync)
+
+
+@pytest.fixture(params=["process", "shared"])
+def replicas(request, tmp_path, data_dir):
+    """Two inventories: one process's twice, or two processes' sharing a database"""
+    if request.param == "shared":
+        return [open_replica(tmp_path, data_dir) for _ in range(2)]
+    products = MemoryRepository("products", LogStore(data_dir, database.log_dir))
+    inventory = Inventory(products)
+    return [(products, inventory)] * 2
+
+
+def test_concurrent_reserves_never_oversell(replicas):
+    # 49 of the 50 units are taken, then 20 carts race for the last one on both replicas
+    _, first = replicas[0]
+    first.reserve("order-1", {"prod-001": 49})
+    won, errors = [], []
+    start = threading.Barrier(20)
+
+    def reserve(inventory, holder):
+        start.wait()
+        try:
+            inventory.reserve(holder, {"prod-001": 1})
+            won.append(holder)
+        except InsufficientStock:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reserve, args=(replicas[i % 2][1], f"cart:user-{i}")) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(won) == 1
+    assert [inventory.available("prod-001") for _, inventory in replicas] == [0, 0]
+
+
+def test_commit_on_other_replica(replicas):
+    (products_a, a), (products_b, b) = replicas
+    a.reserve("order-1", {"prod-001": 2})
+    b.commit("order-1", {"prod-001": 2})
+
+    if isinstance(a, SharedInventory):
+        a.refresh()
+    assert products_a.get("prod-001")["stock"] == 48
+    assert products_b.get("prod-001")["stock"] == 48
+    # The reservation is released with the sale
+    assert b.available("prod-001") == 48
+
+
+def test_shared_reservations_load_once(tmp_path, data_dir):
+    carts = [{"userId": "user-1", "items": [{"productId": "prod-001", "quantity": 3}]}]
+    orders = [{"id": "order-1", "status": "pending", "cart_items": [{"productId": "prod-001", "quantity": 2}]}]
+    _, a = open_replica(tmp_path, data_dir)
+    _, b = open_replica(tmp_path, data_dir)
+    a.load(carts, orders)
+    b.load(carts, orders)
+
+    assert b.available("prod-001") == 45
+
+
+def test_concurrent_confirmations_take_stock_once(replicas, data_dir):
+    stores = [products.store for products, _ in replicas]
+    orders = [MemoryRepository("orders", store) for store in stores]
+    orders[0].insert({"id": "order-1", "status": "pending", "cart_items": [{"productId": "prod-001", "quantity": 2}]})
+    for store in stores:
+        if hasattr(store, "sync"):
+            store.sync()
+    start = threading.Barrier(10)
+
+    def confirm(i):
+        (_, inventory), repo = replicas[i % 2], orders[i % 2]
+
+        def transition():
+            if repo.get("order-1")["status"] != "pending":
+                return
+            inventory.commit("order-1", {"prod-001": 2})
+            repo.update("order-1", {"status": "confirmed"})
+
+        start.wait()
+        repo.atomic(transition)
+
+    threads = [threading.Thread(target=confirm, args=(i,)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    products, _ = replicas[0]
+    if hasattr(products.store, "sync"):
+        products.store.sync()
+    assert products.get("prod-001")["stock"] == 48
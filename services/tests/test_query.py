@@ -0,0 +1,56 @@
+import pytest
+
+from utils import database
+from utils.database import FIELD_ALIASES, INDEXES, ORDERED_INDEXES, DataFiles, LogStore
+from utils.query import CursorUnsupported
+from utils.repository import MemoryRepository, SQLiteDatabase, SQLiteRepository
+
+REVIEWS = [
+    {"id": f"review-{i}", "product_id": f"prod-00{i % 2}", "rating": 1 + i % 5, "createdAt": f"2024-01-{30 - i:02d}"}
+    for i in range(1, 11)
+]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def reviews(request, tmp_path, data_dir):
+    DataFiles(data_dir, snapshots=False).write("reviews", REVIEWS)
+    if request.param == "sqlite":
+        db = SQLiteDatabase(
+            str(tmp_path / "petstore.sqlite"),
+            seed=lambda name: LogStore(data_dir, database.log_dir).collection(name),
+            indexes={"reviews": INDEXES["reviews"] + ORDERED_INDEXES["reviews"]},
+            aliases=FIELD_ALIASES,
+            watch_interval=0,
+        )
+        return SQLiteRepository("reviews", db)
+    return MemoryRepository("reviews", LogStore(data_dir, database.log_dir))
+
+
+def pages(query, limit):
+    ids, after = [], None
+    while True:
+        page, after = query.seek(after, limit)
+        ids.append([review["id"] for review in page])
+        if len(page) < limit:
+            return ids
+
+
+def test_product_reviews_by_cursor(reviews):
+    query = reviews.query(product_id="prod-001").order_by("createdAt", reverse=True)
+    assert pages(query, 2) == [["review-1", "review-3"], ["review-5", "review-7"], ["review-9"]]
+    assert pages(reviews.query(product_id="prod-000"), 3) == [["review-10", "review-2", "review-4"],
+                                                              ["review-6", "review-8"]]
+
+
+def test_product_reviews_follow_writes(reviews):
+    reviews.update("review-3", {"product_id": "prod-000"})
+    reviews.delete("review-5")
+    reviews.insert({"id": "review-11", "product_id": "prod-001", "rating": 4, "createdAt": "2024-02-01"})
+
+    query = reviews.query(product_id="prod-001").order_by("createdAt")
+    assert pages(query, 10) == [["review-9", "review-7", "review-1", "review-11"]]
+
+
+def test_cursor_needs_an_ordered_index(reviews):
+    with pytest.raises(CursorUnsupported):
+        reviews.query(product_id="prod-001").order_by("rating").seek(None, 2)
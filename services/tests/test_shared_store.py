@@ -0,0 +1,97 @@
+import pytest
+
+from utils import database
+from utils.database import LogStore, SharedStore
+from utils.repository import DuplicateId, MemoryRepository, SQLiteDatabase
+
+
+def open_shared(tmp_path, data_dir):
+    # No sync thread: the tests call sync() themselves
+    store = SharedStore(SQLiteDatabase(str(tmp_path / "shared.db")), data_dir, sync_interval=0)
+    store.open()
+    return store
+
+
+def test_two_writers_converge(tmp_path, data_dir):
+    a, b = open_shared(tmp_path, data_dir), open_shared(tmp_path, data_dir)
+    products_a, products_b = MemoryRepository("products", a), MemoryRepository("products", b)
+
+    # Both write the same record within one sync interval
+    products_a.update("prod-001", {"stock": 10})
+    products_b.update("prod-001", {"stock": 20})
+    a.sync()
+    b.sync()
+
+    stored = open_shared(tmp_path, data_dir).collection("products").get("prod-001")
+    assert stored["stock"] == 20
+    assert products_a.get("prod-001")["stock"] == 20
+    assert products_b.get("prod-001")["stock"] == 20
+
+
+def test_sync_replays_own_writes_in_order(tmp_path, data_dir):
+    a, b = open_shared(tmp_path, data_dir), open_shared(tmp_path, data_dir)
+    products_a, products_b = MemoryRepository("products", a), MemoryRepository("products", b)
+
+    products_b.update("prod-001", {"stock": 20})
+    products_a.update("prod-001", {"stock": 10})
+    b.sync()
+    a.sync()
+
+    assert products_a.get("prod-001")["stock"] == 10
+    assert products_b.get("prod-001")["stock"] == 10
+
+
+def test_delete_reaches_other_writer(tmp_path, data_dir):
+    a, b = open_shared(tmp_path, data_dir), open_shared(tmp_path, data_dir)
+    products_a, products_b = MemoryRepository("products", a), MemoryRepository("products", b)
+
+    products_a.update("prod-001", {"stock": 10})
+    products_b.delete("prod-001")
+    a.sync()
+    b.sync()
+
+    assert products_a.get("prod-001") is None
+    assert products_b.get("prod-001") is None
+
+
+@pytest.fixture(params=["log", "shared"])
+def store(request, tmp_path, data_dir):
+    if request.param == "shared":
+        return open_shared(tmp_path, data_dir)
+    return LogStore(data_dir, database.log_dir)
+
+
+def insert_pets(pets, names):
+    for name in names:
+        pets.insert({"id": pets.new_id("pet"), "name": name})
+
+
+def test_new_id_not_reused_after_delete(store):
+    pets = MemoryRepository("pets", store)
+    insert_pets(pets, "abc")
+    pets.delete("pet-1")
+    insert_pets(pets, "d")
+
+    assert sorted((pet["id"], pet["name"]) for pet in pets) == [("pet-2", "b"), ("pet-3", "c"), ("pet-4", "d")]
+
+
+def test_new_id_after_restart(data_dir):
+    pets = MemoryRepository("pets", LogStore(data_dir, database.log_dir))
+    insert_pets(pets, "abc")
+    pets.delete("pet-1")
+    pets.store.flush()
+
+    restarted = MemoryRepository("pets", LogStore(data_dir, database.log_dir))
+    insert_pets(restarted, "d")
+    assert {pet["id"]: pet["name"] for pet in restarted} == {"pet-2": "b", "pet-3": "c", "pet-4": "d"}
+
+
+def test_insert_rejects_existing_id(store):
+    pets = MemoryRepository("pets", store)
+    insert_pets(pets, "ab")
+
+    with pytest.raises(DuplicateId):
+        pets.insert({"id": "pet-2", "name": "x"})
+    with pytest.raises(DuplicateId):
+        pets.insert_many([{"id": "pet-9", "name": "y"}, {"id": "pet-9", "name": "z"}])
+    assert [pet["name"] for pet in pets] == ["a", "b"]
@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+from utils import snapshot
+from utils.database import DataFiles
+from utils.snapshot import SnapshotError, read_snapshot, snapshot_path, write_snapshot
+
+
+@pytest.fixture
+def source(tmp_path):
+    DataFiles(str(tmp_path)).write("products", [{"id": "prod-001", "stock": 50}])
+    return str(tmp_path / "products.json")
+
+
+def test_same_size_rewrite_within_mtime_is_stale(source):
+    before = os.stat(source)
+    with open(source, "w", encoding="utf-8") as file:
+        json.dump([{"id": "prod-001", "stock": 49}], file, indent=4)
+    os.utime(source, ns=(before.st_atime_ns, before.st_mtime_ns))
+    assert os.stat(source).st_size == before.st_size
+
+    assert read_snapshot(source) is None
+    assert DataFiles(os.path.dirname(source)).read("products")[0]["stock"] == 49
+
+
+def test_snapshot_of_another_interpreter_is_rebuilt(source, monkeypatch):
+    monkeypatch.setattr(snapshot, "INTERPRETER", b"pypy-3.9")
+    write_snapshot(source, [{"id": "prod-001", "stock": 1}])
+    monkeypatch.undo()
+
+    with pytest.raises(SnapshotError):
+        read_snapshot(source)
+    assert DataFiles(os.path.dirname(source)).read("products")[0]["stock"] == 50
+    assert read_snapshot(source) == [{"id": "prod-001", "stock": 50}]
+
+
+def test_older_format_is_rejected(source):
+    with open(snapshot_path(source), "r+b") as file:
+        file.seek(4)
+        file.write((1).to_bytes(2, "little"))
+    with pytest.raises(SnapshotError):
+        read_snapshot(source)
+    assert DataFiles(os.path.dirname(source)).read("products")[0]["stock"] == 50
@@ -0,0 +1,70 @@
+import pytest
+
+from utils import database
+from utils.database import FIELD_ALIASES, DataFiles, LogStore
+from utils.repository import DuplicateId, MemoryRepository, SQLiteDatabase, SQLiteRepository
+
+
+def open_sqlite(tmp_path, data_dir):
+    # No watch thread: the tests call poll() themselves
+    return SQLiteDatabase(
+        str(tmp_path / "petstore.sqlite"),
+        seed=lambda name: LogStore(data_dir, database.log_dir).collection(name),
+        watch_interval=0,
+    )
+
+
+def test_listener_sees_other_process_writes(tmp_path, data_dir):
+    a, b = open_sqlite(tmp_path, data_dir), open_sqlite(tmp_path, data_dir)
+    products_a, products_b = SQLiteRepository("products", a), SQLiteRepository("products", b)
+    seen = []
+    products_a.subscribe(lambda op, record: seen.append((op, record["id"], record.get("stock"))))
+
+    products_b.update("prod-001", {"stock": 20})
+    products_b.insert({"id": "prod-002", "name": "Arena", "stock": 5})
+    products_b.delete("prod-001")
+    a.poll()
+
+    assert seen == [("put", "prod-001", 20), ("put", "prod-002", 5), ("delete", "prod-001", 20)]
+    assert products_a.get_many(["prod-001", "prod-002"]) == [products_b.get("prod-002")]
+
+
+def test_own_writes_notified_once(tmp_path, data_dir):
+    a = open_sqlite(tmp_path, data_dir)
+    products = SQLiteRepository("products", a)
+    seen = []
+    products.subscribe(lambda op, record: seen.append((op, record["id"])))
+
+    products.update("prod-001", {"stock": 10})
+    a.poll()
+
+    assert seen == [("put", "prod-001")]
+
+
+def test_new_id_not_reused_after_delete(tmp_path, data_dir):
+    pets = SQLiteRepository("pets", open_sqlite(tmp_path, data_dir))
+    for name in "abc":
+        pets.insert({"id": pets.new_id("pet"), "name": name})
+    pets.delete("pet-3")
+
+    restarted = SQLiteRepository("pets", open_sqlite(tmp_path, data_dir))
+    assert restarted.new_id("pet") == "pet-4"
+    with pytest.raises(DuplicateId):
+        restarted.insert({"id": "pet-2", "name": "x"})
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_seed_field_spellings_are_normalized(tmp_path, data_dir, backend):
+    DataFiles(data_dir, snapshots=False).write("reviews", [
+        {"id": "review-001", "productId": "prod-001", "userId": "user-001", "rating": 5},
+        {"id": "review-002", "product_id": "prod-001", "user_id": "user-002", "rating": 3},
+    ])
+    if backend == "sqlite":
+        db = open_sqlite(tmp_path, data_dir)
+        db.aliases = FIELD_ALIASES
+        reviews = SQLiteRepository("reviews", db)
+    else:
+        reviews = MemoryRepository("reviews", LogStore(data_dir, database.log_dir))
+
+    assert [review["id"] for review in reviews.query(product_id="prod-001").all()] == ["review-001", "review-002"]
+    assert reviews.get("review-001") == {"id": "review-001", "product_id": "prod-001", "user_id": "user-001", "rating": 5}
@@ -1,25 +1,898 @@
+import atexit
+import bisect
+import gc
 import json
 import os
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # No flock (Windows): a log directory must then be written by one process only
+    fcntl = None
+from utils.query import sort_key
+from utils.repository import MemoryRepository, SQLiteDatabase, SQLiteRepository, _last_number
+from utils.snapshot import SnapshotError, read_snapshot, write_snapshot
 
-# Define path to mock database
-mock_db_path = os.path.join(os.path.dirname(__file__), "../mock_database.json")
-
-# Load mock database
-if os.path.exists(mock_db_path):
-    with open(mock_db_path, "r") as file:
-        data = json.load(file)
-        products_db = data.get("products", [])
-        categories_db = data.get("categories", [])
-        users_db = data.get("users", [])
-        cart_db = data.get("cart", [])
-        orders_db = data.get("orders", [])
-        reviews_db = data.get("reviews", [])
-        pets_db = data.get("pets", [])
+# Data files: one JSON file per collection, listed in a manifest
+data_dir = os.getenv("DB_DATA_DIR", os.path.normpath(os.path.join(os.path.dirname(__file__), "../data")))
+MANIFEST = "manifest.json"
+
+# Keep a binary snapshot next to each data file and load from it while it is fresh
+SNAPSHOTS = os.getenv("DB_SNAPSHOTS", "true").lower() == "true"
+
+# Single-file database of earlier versions, split into data files on first start
+legacy_db_path = os.path.join(os.path.dirname(__file__), "../mock_database.json")
+
+# Write-ahead logs, one file per collection
+log_dir = os.getenv("DB_LOG_DIR", os.path.join(os.path.dirname(__file__), "../wal"))
+
+# Number of logged mutations after which the logs are folded into the data files
+COMPACT_THRESHOLD = int(os.getenv("DB_COMPACT_THRESHOLD", 1000))
+
+# Group commit: logged mutations are buffered and written + fsynced together by a
+# background thread every FLUSH_INTERVAL seconds, or sooner once FLUSH_THRESHOLD are waiting
+FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", 0.05))
+FLUSH_THRESHOLD = int(os.getenv("DB_FLUSH_THRESHOLD", 500))
+
+# Shared-state mode: processes on one node (e.g. docker-compose replicas) share one
+# SQLite dataset at this path instead of each keeping its own logs. The sqlite backend
+# uses it too (by default, petstore.sqlite in the data directory).
+shared_db_path = os.getenv("DB_SHARED_PATH")
+
+# Seconds between checks for changes written by other processes (shared-state mode,
+# and the sqlite backend's collection listeners)
+SYNC_INTERVAL = float(os.getenv("DB_SYNC_INTERVAL", 0.1))
+
+# Change-feed entries kept for incremental sync; a process further behind reloads everything
+FEED_RETENTION = int(os.getenv("DB_FEED_RETENTION", 100000))
+
+COLLECTIONS = ("products", "categories", "users", "cart", "orders", "reviews", "pets")
+
+# Repository backend: "memory" keeps collections in memory and persists them through
+# `store`; "sqlite" queries an embedded SQLite database (WAL mode) in place
+DB_BACKEND = os.getenv("DB_BACKEND", "memory").lower()
+
+# Secondary indexes kept in sync for foreign-key filters, per collection
+INDEXES = {
+    "users": ("username",),
+    "cart": ("userId",),
+    "orders": ("user_id",),
+    "reviews": ("product_id",),
+    "pets": ("owner_id",),
+}
+
+# Older spellings of fields, renamed when a collection is read: the seed reviews say
+# productId/userId where the API, the indexes and the queries say product_id/user_id
+FIELD_ALIASES = {
+    "reviews": {"productId": "product_id", "userId": "user_id"},
+}
+
+# Ordered (sort key, id) indexes backing cursor pagination, per collection. A (group, field)
+# pair keeps one such index per value of `group`, for cursors over query(group=value).
+ORDERED_INDEXES = {
+    "products": ("id", "price"),
+    "orders": ("id", "createdAt"),
+    "reviews": ("id", "createdAt", ("product_id", "id"), ("product_id", "createdAt")),
+}
+
+
+class Collection(list):
+    """List of records that keeps a hash index on `id` for O(1) point lookups,
+    plus optional secondary indexes on foreign-key fields and ordered indexes
+    on sort keys."""
+
+    def __init__(self, records=(), indexes=(), ordered=()):
+        super().__init__(records)
+        self._indexes = {field: {} for field in indexes}
+        self._ordered = {field: [] for field in ordered if isinstance(field, str)}
+        self._grouped = {pair: {} for pair in ordered if not isinstance(pair, str)}  # (group, field) -> {value: keys}
+        self._listeners = []
+        self._reindex()
+
+    def _reindex(self):
+        self._by_id = {}
+        for index in self._indexes.values():
+            index.clear()
+        for field in self._ordered:
+            self._ordered[field] = sorted(sort_key(record, field) for record in self)
+        for (group, field), groups in self._grouped.items():
+            groups.clear()
+            for record in self:
+                if record.get(group) is not None:
+                    groups.setdefault(record[group], []).append(sort_key(record, field))
+            for keys in groups.values():
+                keys.sort()
+        for record in self:
+            self._index_add(record, ordered=False)
+
+    def _index_add(self, record, ordered=True):
+        self._by_id[record["id"]] = record
+        for field, index in self._indexes.items():
+            value = record.get(field)
+            if value is not None:
+                index.setdefault(value, {})[record["id"]] = record
+        if ordered:
+            for field, keys in self._ordered.items():
+                bisect.insort(keys, sort_key(record, field))
+            for (group, field), groups in self._grouped.items():
+                if record.get(group) is not None:
+                    bisect.insort(groups.setdefault(record[group], []), sort_key(record, field))
+
+    @staticmethod
+    def _remove_key(keys, record, field):
+        # False if the record's key is not where its current field value puts it
+        key = sort_key(record, field)
+        position = bisect.bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            del keys[position]
+            return True
+        return False
+
+    def _index_remove(self, record):
+        self._by_id.pop(record["id"], None)
+        for field, index in self._indexes.items():
+            bucket = index.get(record.get(field))
+            if bucket is not None:
+                bucket.pop(record["id"], None)
+                if not bucket:
+                    del index[record.get(field)]
+        for field, keys in self._ordered.items():
+            if not self._remove_key(keys, record, field):
+                # The sort field was changed in place, so the old key is unknown
+                keys[:] = [k for k in keys if k[2] != record["id"]]
+        for (group, field), groups in self._grouped.items():
+            keys = groups.get(record.get(group))
+            if keys is not None and self._remove_key(keys, record, field):
+                if not keys:
+                    del groups[record[group]]
+                continue
+            # A field was changed in place: look for the record in every group
+            for value, keys in list(groups.items()):
+                keys[:] = [k for k in keys if k[2] != record["id"]]
+                if not keys:
+                    del groups[value]
+
+    def subscribe(self, listener):
+        """Call `listener(op, record)` after every change: op is "put", "delete" or "reset" """
+        self._listeners.append(listener)
+
+    def _notify(self, op, record=None):
+        for listener in self._listeners:
+            listener(op, record)
+
+    def get(self, record_id, default=None):
+        """Return the record with this id, or `default`"""
+        return self._by_id.get(record_id, default)
+
+    def has_index(self, field):
+        """Whether find_by()/first_by() can look up `field`"""
+        return field in self._indexes
+
+    def find_by(self, field, value):
+        """Return the records whose indexed `field` equals `value`"""
+        return list(self._indexes[field].get(value, {}).values())
+
+    def ordered_index(self, field, group=None):
+        """Sorted list of sort_key() entries for `field`, or None if it is not indexed.
+        With group=(group field, value), the entries of the records in that group."""
+        if group is None:
+            return self._ordered.get(field)
+        groups = self._grouped.get((group[0], field))
+        if groups is None:
+            return None
+        return groups.get(group[1], [])
+
+    def first_by(self, field, value, default=None):
+        """Return the first record whose indexed `field` equals `value`, or `default`"""
+        return next(iter(self._indexes[field].get(value, {}).values()), default)
+
+    def update(self, record_id, changes):
+        """Apply `changes` to a record in place, keeping the indexes in sync"""
+        record = self._by_id.get(record_id)
+        if record is not None:
+            self._index_remove(record)
+            record.update(changes)
+            self._index_add(record)
+            self._notify("put", record)
+        return record
+
+    def upsert(self, record):
+        """Insert a record, or replace the stored record with the same id in place"""
+        existing = self._by_id.get(record["id"])
+        if existing is None:
+            self.append(record)
+            return record
+        self._index_remove(existing)
+        existing.clear()
+        existing.update(record)
+        self._index_add(existing)
+        self._notify("put", existing)
+        return existing
+
+    def append(self, record):
+        super().append(record)
+        self._index_add(record)
+        self._notify("put", record)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def __iadd__(self, records):
+        self.extend(records)
+        return self
+
+    def insert(self, index, record):
+        super().insert(index, record)
+        self._index_add(record)
+        self._notify("put", record)
+
+    def remove(self, record):
+        super().remove(record)
+        self._index_remove(record)
+        self._notify("delete", record)
+
+    def delete(self, record_id):
+        """Remove the record with this id and return it, or None if missing"""
+        record = self._by_id.get(record_id)
+        if record is not None:
+            self.remove(record)
+        return record
+
+    def pop(self, index=-1):
+        record = super().pop(index)
+        self._index_remove(record)
+        self._notify("delete", record)
+        return record
+
+    def clear(self):
+        super().clear()
+        self._reindex()
+        self._notify("reset")
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._reindex()
+        self._notify("reset")
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._reindex()
+        self._notify("reset")
+
+
+def _fsync_dir(path):
+    """Sync a directory, so the renames and removals made in it are on disk"""
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_json(path, data):
+    """Replace a file atomically: write a temporary copy, sync it, rename it over"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=4, ensure_ascii=False)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+@contextmanager
+def _gc_paused():
+    """Decoding a data file allocates millions of containers: skip the collector passes they would trigger"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class DataFiles:
+    """The per-collection data files and the manifest listing them"""
+
+    def __init__(self, data_dir, snapshots=SNAPSHOTS):
+        self.data_dir = data_dir
+        self.snapshots = snapshots
+        self._lock = threading.Lock()
+
+    def _manifest_path(self):
+        return os.path.join(self.data_dir, MANIFEST)
+
+    def manifest(self):
+        """The manifest: {"version": 1, "collections": {name: {"file", "records"}}}"""
+        path = self._manifest_path()
+        if not os.path.exists(path):
+            if os.path.exists(legacy_db_path):
+                self.migrate(legacy_db_path)
+            else:
+                return {"version": 1, "collections": {}}
+        with open(path, "r") as file:
+            return json.load(file)
+
+    def read(self, name):
+        """Records of one collection (empty if it has no data file yet)"""
+        entry = self.manifest()["collections"].get(name)
+        if entry is None:
+            return []
+        path = os.path.join(self.data_dir, entry["file"])
+        with _gc_paused():
+            if self.snapshots:
+                try:
+                    records = read_snapshot(path)
+                    if records is not None:
+                        return records
+                except SnapshotError:
+                    # A corrupt snapshot is rebuilt from the JSON file below
+                    pass
+            with open(path, "rb") as file:
+                content = file.read()
+            records = json.loads(content)
+        self._snapshot(path, records, zlib.crc32(content))
+        return records
+
+    def _snapshot(self, path, records, source_crc=None):
+        if not self.snapshots:
+            return
+        try:
+            write_snapshot(path, records, source_crc)
+        except OSError:
+            # Read-only data directory: keep serving from JSON
+            pass
+
+    def write(self, name, records):
+        """Replace one collection's data file, then its manifest entry"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        with self._lock:
+            manifest = self.manifest()
+            entry = manifest["collections"].get(name, {"file": f"{name}.json"})
+            path = os.path.join(self.data_dir, entry["file"])
+            _write_json(path, records)
+            self._snapshot(path, records)
+            manifest["collections"][name] = dict(entry, records=len(records))
+            _write_json(self._manifest_path(), manifest)
+
+    def migrate(self, path):
+        """Split a single-file database ({collection: [records]}) into data files"""
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        os.makedirs(self.data_dir, exist_ok=True)
+        manifest = {"version": 1, "collections": {}}
+        for name, records in data.items():
+            _write_json(os.path.join(self.data_dir, f"{name}.json"), records)
+            manifest["collections"][name] = {"file": f"{name}.json", "records": len(records)}
+        _write_json(self._manifest_path(), manifest)
+
+
+def _normalize(name, records):
+    """Rename the FIELD_ALIASES of these records in place; returns them"""
+    aliases = FIELD_ALIASES.get(name)
+    if aliases:
+        for record in records:
+            for old, new in aliases.items():
+                if old in record:
+                    value = record.pop(old)
+                    record.setdefault(new, value)
+    return records
+
+
+def _collection(name, records):
+    return Collection(_normalize(name, list(records)), INDEXES.get(name, ()), ORDERED_INDEXES.get(name, ()))
+
+
+class LogStore:
+    """Append-only storage engine: one log per collection, compacted into that collection's data file.
+    Collections are read on first use, so a process only pays for the ones it touches.
+
+    Writes are group-committed: put() and delete() only buffer the entry, and a
+    flusher thread appends everything buffered with one write and one fsync per
+    log. barrier() waits until the writes made so far are on disk.
+
+    Several processes may share the log directory. Appends and log rotations take
+    an exclusive flock on `logs.lock` (loads a shared one), and an appender reopens
+    a log another process rotated, so no write lands in a log that is being folded.
+    A single process at a time compacts, holding `compact.lock` until the rotated
+    logs are folded and removed."""
+
+    def __init__(self, data_dir, log_dir, compact_threshold=COMPACT_THRESHOLD,
+                 flush_interval=FLUSH_INTERVAL, flush_threshold=FLUSH_THRESHOLD):
+        self.data = DataFiles(data_dir)
+        self.log_dir = log_dir
+        self.compact_threshold = compact_threshold
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.collections = {}
+        self._files = {}
+        self._load_lock = threading.Lock()
+        self._atomic_lock = threading.RLock()
+        self._sequences = {}  # name -> last id number handed out
+        # Buffered entries, guarded by _lock
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._buffer = {}  # name -> [log lines]
+        self._buffered = 0
+        self._enqueued = 0  # entries buffered since start
+        self._durable = 0  # entries on disk since start
+        self._flush_requested = False
+        self._flusher = None
+        # Log files and compaction, guarded by _io_lock
+        self._io_lock = threading.Lock()
+        self._pending = 0
+        self._compacting = False
+
+    def _log_path(self, name, suffix=".log"):
+        return os.path.join(self.log_dir, f"{name}{suffix}")
+
+    @contextmanager
+    def _locked_logs(self, shared=False):
+        # Held across appends, rotations and loads, by every process using this log directory
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        with open(os.path.join(self.log_dir, "logs.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+
+    def _compaction_lock(self):
+        # The open lock file if this process may compact now (closing it releases the
+        # lock), None if another process is compacting
+        os.makedirs(self.log_dir, exist_ok=True)
+        lock = open(os.path.join(self.log_dir, "compact.lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                return None
+        return lock
+
+    def collection(self, name):
+        """A collection, read from its data file and logs on first use"""
+        with self._load_lock:
+            if name not in self.collections:
+                with self._locked_logs(shared=True):
+                    records = {record["id"]: record for record in self.data.read(name)}
+                    # Logs left behind by an interrupted compaction are replayed first
+                    for path in (self._log_path(name, ".log.compacting"), self._log_path(name)):
+                        self._replay(path, records)
+                self.collections[name] = _collection(name, records.values())
+            return self.collections[name]
+
+    def load(self):
+        """Read every collection now"""
+        for name in COLLECTIONS:
+            self.collection(name)
+        return self.collections
+
+    @staticmethod
+    def _replay(path, records):
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-append is ignored
+                    continue
+                if entry["op"] == "put":
+                    records[entry["record"]["id"]] = entry["record"]
+                elif entry["op"] == "delete":
+                    records.pop(entry["id"], None)
+
+    def _file(self, name):
+        # Called with the logs locked. A log another process rotated since it was
+        # opened is reopened, so nothing is appended to a log being folded.
+        path = self._log_path(name)
+        file = self._files.get(name)
+        if file is not None:
+            try:
+                rotated = not os.path.samestat(os.stat(path), os.fstat(file.fileno()))
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                file.close()
+                file = None
+        if file is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            file = self._files[name] = open(path, "a")
+        return file
+
+    def _append(self, name, entries):
+        lines = [json.dumps(entry) + "\n" for entry in entries]
+        with self._lock:
+            self._buffer.setdefault(name, []).extend(lines)
+            self._buffered += len(lines)
+            self._enqueued += len(lines)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+                # What is still buffered at exit is written then
+                atexit.register(self.flush)
+            if self._buffered >= self.flush_threshold:
+                self._flush_requested = True
+                self._flushed.notify_all()
+            return self._enqueued
+
+    def put(self, name, record):
+        """Log an inserted or updated record"""
+        self._append(name, [{"op": "put", "record": record}])
+
+    def put_many(self, name, records):
+        """Log a batch of records, on disk before returning"""
+        if records:
+            self.barrier(self._append(name, [{"op": "put", "record": record} for record in records]))
+
+    def delete(self, name, record_id):
+        """Log a deleted record"""
+        self._append(name, [{"op": "delete", "id": record_id}])
+
+    def barrier(self, position=None, timeout=None):
+        """Wait until every write logged so far (or up to `position`) is on disk.
+        Returns False if `timeout` seconds passed first.
+
+        A write it acknowledged stays on disk across compactions by any process: it is
+        in a log no one rotates mid-append, and that log is only removed once the data
+        file holding the write is synced."""
+        with self._lock:
+            position = self._enqueued if position is None else position
+            if self._durable >= position:
+                return True
+            # Flush now instead of at the end of the interval
+            self._flush_requested = True
+            self._flushed.notify_all()
+            return self._flushed.wait_for(lambda: self._durable >= position, timeout)
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                self._flushed.wait_for(lambda: self._flush_requested, self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                # Disk full or unavailable: the entries stay buffered and are retried next time
+                time.sleep(self.flush_interval)
+
+    def flush(self):
+        """Append every buffered entry to its log: one write and one fsync per collection"""
+        with self._io_lock:
+            with self._lock:
+                buffer, self._buffer = self._buffer, {}
+                count, self._buffered = self._buffered, 0
+                position = self._enqueued
+                self._flush_requested = False
+            try:
+                with self._locked_logs():
+                    for name, lines in buffer.items():
+                        file = self._file(name)
+                        file.write("".join(lines))
+                        file.flush()
+                        os.fsync(file.fileno())
+            except OSError:
+                with self._lock:
+                    # Put the entries back in front of those buffered meanwhile
+                    for name, lines in buffer.items():
+                        self._buffer[name] = lines + self._buffer.get(name, [])
+                    self._buffered += count
+                # The files may hold a partial write: reopen them (a torn line is skipped on replay)
+                for file in self._files.values():
+                    file.close()
+                self._files = {}
+                raise
+            self._pending += count
+            if self._pending >= self.compact_threshold and not self._compacting:
+                self._start_compaction()
+        with self._lock:
+            self._durable = max(self._durable, position)
+            self._flushed.notify_all()
+
+    def _rotate(self):
+        # Called with the I/O lock held: rotate the logs and return (the compaction
+        # lock, names of the rotated logs), or None if another process is compacting
+        owner = self._compaction_lock()
+        if owner is None:
+            return None
+        self._compacting = True
+        self._pending = 0
+        names = []
+        with self._locked_logs():
+            for name in COLLECTIONS:
+                active, compacting = self._log_path(name), self._log_path(name, ".log.compacting")
+                if os.path.exists(active):
+                    if os.path.exists(compacting):
+                        # Keep the entries of an interrupted compaction until this one lands
+                        with open(active, "r") as src, open(compacting, "a") as dst:
+                            shutil.copyfileobj(src, dst)
+                        os.remove(active)
+                    else:
+                        os.replace(active, compacting)
+                if os.path.exists(compacting):
+                    names.append(name)
+            # The rotated logs hold writes barrier() acknowledged: their new names must survive a crash
+            _fsync_dir(self.log_dir)
+        return owner, names
+
+    def _start_compaction(self):
+        # Called with the I/O lock held: rotate the logs; folding them into the
+        # data files then happens off the request path.
+        rotated = self._rotate()
+        if rotated is not None:
+            threading.Thread(target=self._compact, args=rotated, daemon=True).start()
+
+    def _compact(self, owner, names):
+        # Each data file is rebuilt from the file itself plus its rotated log, not from
+        # memory, so collections this process never loaded are folded correctly too.
+        # No process appends to a rotated log, and it is only removed, together with
+        # the data file replacing it, while loads are locked out.
+        try:
+            for name in names:
+                path = self._log_path(name, ".log.compacting")
+                records = {record["id"]: record for record in self.data.read(name)}
+                self._replay(path, records)
+                with self._locked_logs():
+                    # The data file is synced (see _write_json) before the log is dropped
+                    self.data.write(name, list(records.values()))
+                    os.remove(path)
+        finally:
+            owner.close()
+            with self._io_lock:
+                self._compacting = False
+
+    def compact(self):
+        """Fold the logs into the data files now (unless a compaction is already running
+        in this process or another one)"""
+        self.flush()
+        with self._io_lock:
+            if self._compacting:
+                return
+            rotated = self._rotate()
+        if rotated is not None:
+            self._compact(*rotated)
+
+    def atomic(self, fn):
+        """Run `fn()` while no other atomic() of this process runs. Each process keeps its
+        own copy of the collections, so that is as far as their updates can conflict."""
+        with self._atomic_lock:
+            return fn()
+
+    def new_id(self, name, prefix):
+        """Id for a new record of a collection, unique even before the record is stored"""
+        collection = self.collection(name)
+        with self._lock:
+            if name not in self._sequences:
+                self._sequences[name] = _last_number(record["id"] for record in collection)
+            self._sequences[name] += 1
+            return f"{prefix}-{self._sequences[name]}"
+
+
+class SharedStore:
+    """Shared-state storage engine: several processes on one node share a
+    SQLiteDatabase, whose `records` table holds the current records and whose
+    change feed counts every committed write. Each process serves reads from its
+    in-memory collections and pulls the feed entries it has not seen yet, so a
+    write on one replica reaches the others within SYNC_INTERVAL. Like LogStore,
+    it reads a collection into memory only on first use.
+
+    Every record in memory remembers the feed version it reflects, so entries are
+    replayed in version order, this process's own included, and one is only
+    skipped when the record already reflects it or a later write."""
+
+    def __init__(self, database, data_dir, sync_interval=SYNC_INTERVAL):
+        self.database = database
+        self.data_dir = data_dir
+        self.sync_interval = sync_interval
+        self.collections = {}
+        self.version = 0
+        self._versions = {}  # name -> {record_id: feed version of the write its copy reflects}
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Open (and on first use seed) the shared database"""
+        self.database.conn().execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                collection TEXT NOT NULL, id TEXT NOT NULL, record TEXT NOT NULL, version INTEGER NOT NULL,
+                PRIMARY KEY (collection, id))
+        """)
+
+        def seed(conn):
+            # The first process imports the data files and this node's logs
+            if conn.execute("SELECT 1 FROM seeded WHERE name = 'records'").fetchone():
+                return
+            for name, records in LogStore(self.data_dir, log_dir).load().items():
+                conn.executemany(
+                    "INSERT OR REPLACE INTO records (collection, id, record, version) VALUES (?, ?, ?, 0)",
+                    [(name, record["id"], json.dumps(record)) for record in records],
+                )
+            conn.execute("INSERT INTO seeded (name) VALUES ('records')")
+
+        self.database.transaction(seed)
+        self.version = self.database.latest_version(self.database.conn())
+        if self.sync_interval:
+            threading.Thread(target=self._sync_loop, daemon=True).start()
+
+    def collection(self, name):
+        """A collection, read from the database on first use.
+
+        Its records may be newer than self.version; the next sync skips the
+        feed entries they already reflect."""
+        with self._lock:
+            if name not in self.collections:
+                _, data = self._read_all([name])
+                self._load(name, data[name])
+            return self.collections[name]
+
+    def _load(self, name, rows):
+        self._versions[name] = {record["id"]: version for record, version in rows}
+        records = [record for record, _ in rows]
+        if name in self.collections:
+            self.collections[name][:] = records
+        else:
+            self.collections[name] = _collection(name, records)
+
+    def load(self):
+        """Read every collection now"""
+        for name in COLLECTIONS:
+            self.collection(name)
+        return self.collections
+
+    def _read_all(self, names):
+        """The latest feed version and {name: [(record, version)]} of these collections, read in one transaction"""
+        def read(conn):
+            data = {}
+            for name in names:
+                data[name] = [(json.loads(record), version) for record, version in conn.execute(
+                    "SELECT record, version FROM records WHERE collection = ? ORDER BY rowid", (name,)
+                )]
+            return self.database.latest_version(conn), data
+        return self.database.transaction(read, mode="DEFERRED")
+
+    def _write(self, entries):
+        """Commit [(collection, op, record_id, record)] to the records and the feed at once"""
+        def write(conn):
+            for name, op, record_id, record in entries:
+                version = self.database.log_change(conn, name, op, record_id, record)
+                if op == "put":
+                    conn.execute(
+                        "INSERT INTO records (collection, id, record, version) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (collection, id) DO UPDATE SET record = excluded.record, version = excluded.version",
+                        (name, record_id, json.dumps(record), version),
+                    )
+                else:
+                    conn.execute("DELETE FROM records WHERE collection = ? AND id = ?", (name, record_id))
+                # Noted before the commit, so sync() never applies this entry over the
+                # in-memory copy. The lock is only taken while the database is held for
+                # writing, never the other way round, so writers and sync() cannot deadlock.
+                with self._lock:
+                    self._seen(name, record_id, version)
+
+        self.database.transaction(write)
+
+    def put(self, name, record):
+        """Store an inserted or updated record"""
+        self._write([(name, "put", record["id"], record)])
+
+    def put_many(self, name, records):
+        """Store a batch of records in one transaction"""
+        if records:
+            self._write([(name, "put", record["id"], record) for record in records])
+
+    def delete(self, name, record_id):
+        """Store a deleted record"""
+        self._write([(name, "delete", record_id, None)])
+
+    def _seen(self, name, record_id, version):
+        """Note that the in-memory copy of a record reflects the write at `version`;
+        False if it already reflects that write or a later one"""
+        versions = self._versions.get(name)
+        if versions is None or versions.get(record_id, 0) >= version:
+            return False
+        versions[record_id] = version
+        return True
+
+    def sync(self):
+        """Apply the changes committed since the last sync, in version order"""
+        conn = self.database.conn()
+        with self._lock:
+            rows = self.database.changes(conn, self.version)
+            if rows is None:
+                # The entries this process missed were pruned: reload everything
+                self._reload()
+                return
+            for version, name, op, record_id, record in rows:
+                # Unloaded collections are read whole on first use
+                if not self._seen(name, record_id, version):
+                    continue
+                if op == "put":
+                    self.collections[name].upsert(record)
+                else:
+                    self.collections[name].delete(record_id)
+            if rows:
+                self.version = rows[-1][0]
+
+    def _reload(self):
+        self.version, data = self._read_all(list(self.collections))
+        for name, rows in data.items():
+            self._load(name, rows)
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except sqlite3.Error:
+                # The database is busy or briefly unavailable: retry on the next tick
+                continue
+
+    def barrier(self, position=None, timeout=None):
+        """Wait until every committed write is on disk"""
+        return self.database.barrier()
+
+    def compact(self):
+        """Drop feed entries older than the retention window (records stay current)"""
+        self.database.prune()
+
+    def atomic(self, fn):
+        """Run `fn()` in one transaction holding the database for writing against every
+        process, with the collections synced first, so what it reads is current"""
+        def run(conn):
+            self.sync()
+            return fn()
+        return self.database.transaction(run)
+
+    def new_id(self, name, prefix):
+        """Id for a new record, unique across every process sharing the database"""
+        return self.database.new_id(name, prefix, lambda conn: (record_id for (record_id,) in conn.execute(
+            "SELECT id FROM records WHERE collection = ?", (name,)
+        )))
+
+
+# Collections are read on first access (see __getattr__ below)
+sqlite_db = None
+if DB_BACKEND == "sqlite" or shared_db_path:
+    sqlite_db = SQLiteDatabase(
+        shared_db_path or os.path.join(data_dir, "petstore.sqlite"),
+        # A table is seeded once, from the data files and logs
+        seed=lambda name: LogStore(data_dir, log_dir).collection(name),
+        indexes={name: INDEXES.get(name, ()) + ORDERED_INDEXES.get(name, ()) for name in COLLECTIONS},
+        aliases=FIELD_ALIASES,
+        retention=FEED_RETENTION,
+        prune_every=COMPACT_THRESHOLD,
+        watch_interval=SYNC_INTERVAL,
+    )
+
+if DB_BACKEND == "sqlite":
+    store = None
+elif shared_db_path:
+    store = SharedStore(sqlite_db, data_dir)
+    store.open()
 else:
-    products_db = []
-    categories_db = []
-    users_db = []
-    cart_db = []
-    orders_db = []
-    reviews_db = []
-    pets_db = []
+    store = LogStore(data_dir, log_dir)
+
+def repository(name):
+    """Repository of a collection on the configured backend"""
+    if DB_BACKEND == "sqlite":
+        return SQLiteRepository(name, sqlite_db)
+    return MemoryRepository(name, store)
+
+
+def __getattr__(attr):
+    """Module attributes products_db, categories_db, ... are the collections' repositories,
+    created on first access, so a service only loads the collections it imports."""
+    name = attr[:-len("_db")] if attr.endswith("_db") else None
+    if name not in COLLECTIONS:
+        raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
+    repo = globals()[attr] = repository(name)
+    return repo
@@ -0,0 +1,323 @@
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from utils import database
+
+# Seconds a cart keeps its units reserved without activity before they are released
+CART_RESERVATION_TTL = float(os.getenv("CART_RESERVATION_TTL", 30 * 60))
+
+# Lock stripes: products hash onto one of these, so checkouts on different products rarely contend
+LOCK_STRIPES = int(os.getenv("INVENTORY_LOCK_STRIPES", 64))
+
+
+class InsufficientStock(Exception):
+    """A reservation asked for more units than are available"""
+
+    def __init__(self, product_id, available):
+        super().__init__(f"Not enough stock available for {product_id}")
+        self.product_id = product_id
+        self.available = available
+
+
+def cart_holder(user_id):
+    """Reservation holder of a user's cart"""
+    return f"cart:{user_id}"
+
+
+class Inventory:
+    """Stock reservations on top of products_db.
+
+    A product's `stock` is the units on hand. Carts and pending orders hold
+    reservations against it; available = stock - reserved. Units leave `stock`
+    only when a reservation is committed (order confirmed). Every product is
+    guarded by one of LOCK_STRIPES locks, and multi-product operations take
+    their stripes in a fixed order, so they are atomic without deadlocking."""
+
+    def __init__(self, products, stripes=LOCK_STRIPES):
+        self.products = products
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._held = {}  # product_id -> {holder: [quantity, expires_at or None]}
+        self._reserved = {}  # product_id -> total units held
+
+    def _locked(self, product_ids):
+        """Context manager holding the stripes of these products, in stripe order"""
+        stack = ExitStack()
+        for index in sorted({hash(product_id) % len(self._stripes) for product_id in product_ids}):
+            stack.enter_context(self._stripes[index])
+        return stack
+
+    def _holding(self, product_id, holder, now):
+        """Units `holder` has reserved on a product; an expired reservation is released"""
+        held = self._held.get(product_id, {})
+        entry = held.get(holder)
+        if entry is None:
+            return 0
+        if entry[1] is not None and entry[1] <= now:
+            self._set(product_id, holder, 0, None)
+            return 0
+        return entry[0]
+
+    def _set(self, product_id, holder, quantity, expires_at):
+        held = self._held.setdefault(product_id, {})
+        previous = held[holder][0] if holder in held else 0
+        if quantity:
+            held[holder] = [quantity, expires_at]
+        else:
+            held.pop(holder, None)
+        self._reserved[product_id] = self._reserved.get(product_id, 0) + quantity - previous
+
+    def _available(self, product_id):
+        product = self.products.get(product_id)
+        if product is None:
+            return 0
+        return product["stock"] - self._reserved.get(product_id, 0)
+
+    def available(self, product_id):
+        """Units of a product that can still be reserved"""
+        with self._locked([product_id]):
+            now = time.monotonic()
+            for holder in list(self._held.get(product_id, {})):
+                self._holding(product_id, holder, now)
+            return self._available(product_id)
+
+    def reserve(self, holder, items, ttl=None, source=None, replace=False):
+        """Atomically reserve {product_id: quantity} for `holder`, or raise InsufficientStock.
+
+        - ttl: seconds until the reservation expires (None = until committed or released)
+        - source: another holder whose units on the same products are taken over first,
+          e.g. a cart's reservation becoming an order's
+        - replace: set the holder's reservation to `quantity` instead of adding to it"""
+        with self._locked(items):
+            now = time.monotonic()
+            expires_at = now + ttl if ttl is not None else None
+            plan = []
+            for product_id, quantity in items.items():
+                current = self._holding(product_id, holder, now)
+                target = quantity if replace else current + quantity
+                taken = 0
+                if source is not None and target > current:
+                    taken = min(target - current, self._holding(product_id, source, now))
+                available = self._available(product_id)
+                if target - current - taken > available:
+                    raise InsufficientStock(product_id, available)
+                plan.append((product_id, target, taken))
+
+            for product_id, target, taken in plan:
+                if taken:
+                    quantity, source_expires_at = self._held[product_id][source]
+                    self._set(product_id, source, quantity - taken, source_expires_at)
+                self._set(product_id, holder, target, expires_at)
+
+    def release(self, holder, product_ids):
+        """Give back everything `holder` reserved on these products"""
+        with self._locked(product_ids):
+            for product_id in product_ids:
+                self._set(product_id, holder, 0, None)
+
+    def commit(self, holder, items):
+        """Sell {product_id: quantity}: the units leave the stock for good and
+        `holder`'s reservations on these products are released. The quantities are
+        the order's own, so the sale counts even where this process never saw the
+        reservation (e.g. the order was placed on another replica)."""
+        with self._locked(items):
+            for product_id, quantity in items.items():
+                product = self.products.get(product_id)
+                self._set(product_id, holder, 0, None)
+                if product is not None:
+                    self.products.update(product_id, {"stock": product["stock"] - quantity})
+
+    def expire(self):
+        """Release every expired reservation (abandoned carts)"""
+        now = time.monotonic()
+        for product_id in list(self._held):
+            with self._locked([product_id]):
+                for holder in list(self._held.get(product_id, {})):
+                    self._holding(product_id, holder, now)
+
+    def load(self, carts, orders):
+        """Rebuild reservations from the stored carts and pending orders.
+        Restored cart reservations get a fresh TTL."""
+        now = time.monotonic()
+        for cart in carts:
+            for item in cart.get("items", []):
+                held = self._holding(item["productId"], cart_holder(cart["userId"]), now)
+                self._set(item["productId"], cart_holder(cart["userId"]), held + item["quantity"],
+                          now + CART_RESERVATION_TTL)
+        for order in orders:
+            if order.get("status") != "pending":
+                continue
+            for item in order.get("cart_items", []):
+                held = self._holding(item["productId"], order["id"], now)
+                self._set(item["productId"], order["id"], held + item["quantity"], None)
+
+    def start_expiry(self, interval=60.0):
+        """Sweep expired reservations in a background thread"""
+        def sweep():
+            while True:
+                time.sleep(interval)
+                self.expire()
+        threading.Thread(target=sweep, daemon=True).start()
+
+
+class SharedInventory(Inventory):
+    """Inventory whose reservations live in the SQLiteDatabase shared by the node's
+    processes, so the cart and orders replicas all see each other's reservations.
+
+    Every operation is one IMMEDIATE transaction, which holds the database for writing
+    across processes: a reservation is checked against stock - reserved and recorded
+    atomically, and a commit lowers the stock and drops the reservations together.
+    `refresh` (SharedStore.sync, in shared-state mode) brings this process's copy of
+    the products up to date first; on the sqlite backend reads need no refresh."""
+
+    def __init__(self, products, database, refresh=None):
+        self.products = products
+        self.database = database
+        self.refresh = refresh
+        database.conn().execute("""
+            CREATE TABLE IF NOT EXISTS reservations (
+                product_id TEXT NOT NULL, holder TEXT NOT NULL, quantity INTEGER NOT NULL, expires_at REAL,
+                PRIMARY KEY (product_id, holder))
+        """)
+
+    def _transaction(self, fn):
+        def run(conn):
+            if self.refresh is not None:
+                self.refresh()
+            return fn(conn, time.time())
+        return self.database.transaction(run)
+
+    def _read(self, fn):
+        # Read-only: no write lock, and the products as this process last synced them
+        return self.database.transaction(lambda conn: fn(conn, time.time()), mode="DEFERRED")
+
+    def _holding(self, conn, product_id, holder, now):
+        row = conn.execute(
+            "SELECT quantity, expires_at FROM reservations WHERE product_id = ? AND holder = ?", (product_id, holder)
+        ).fetchone()
+        if row is None:
+            return 0, None
+        if row[1] is not None and row[1] <= now:
+            self._set(conn, product_id, holder, 0, None)
+            return 0, None
+        return row
+
+    def _set(self, conn, product_id, holder, quantity, expires_at):
+        if quantity:
+            conn.execute(
+                "INSERT INTO reservations (product_id, holder, quantity, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (product_id, holder) DO UPDATE SET quantity = excluded.quantity, expires_at = excluded.expires_at",
+                (product_id, holder, quantity, expires_at),
+            )
+        else:
+            conn.execute("DELETE FROM reservations WHERE product_id = ? AND holder = ?", (product_id, holder))
+
+    def _available(self, conn, product_id, now):
+        product = self.products.get(product_id)
+        if product is None:
+            return 0
+        (reserved,) = conn.execute(
+            "SELECT COALESCE(SUM(quantity), 0) FROM reservations "
+            "WHERE product_id = ? AND (expires_at IS NULL OR expires_at > ?)", (product_id, now)
+        ).fetchone()
+        return product["stock"] - reserved
+
+    def available(self, product_id):
+        """Units of a product that can still be reserved"""
+        return self._read(lambda conn, now: self._available(conn, product_id, now))
+
+    def reserve(self, holder, items, ttl=None, source=None, replace=False):
+        """Atomically reserve {product_id: quantity} for `holder`, or raise InsufficientStock
+        (see Inventory.reserve)"""
+        def reserve(conn, now):
+            expires_at = now + ttl if ttl is not None else None
+            plan = []
+            for product_id, quantity in items.items():
+                current, _ = self._holding(conn, product_id, holder, now)
+                target = quantity if replace else current + quantity
+                taken, source_expires_at = 0, None
+                if source is not None and target > current:
+                    held, source_expires_at = self._holding(conn, product_id, source, now)
+                    taken = min(target - current, held)
+                available = self._available(conn, product_id, now)
+                if target - current - taken > available:
+                    raise InsufficientStock(product_id, available)
+                plan.append((product_id, target, taken, source_expires_at))
+
+            for product_id, target, taken, source_expires_at in plan:
+                if taken:
+                    held, _ = self._holding(conn, product_id, source, now)
+                    self._set(conn, product_id, source, held - taken, source_expires_at)
+                self._set(conn, product_id, holder, target, expires_at)
+
+        self._transaction(reserve)
+
+    def release(self, holder, product_ids):
+        """Give back everything `holder` reserved on these products"""
+        def release(conn, now):
+            for product_id in product_ids:
+                self._set(conn, product_id, holder, 0, None)
+        self._transaction(release)
+
+    def commit(self, holder, items):
+        """Sell {product_id: quantity} (see Inventory.commit); the stock update commits
+        with the release of the reservations"""
+        def commit(conn, now):
+            for product_id, quantity in items.items():
+                product = self.products.get(product_id)
+                self._set(conn, product_id, holder, 0, None)
+                if product is not None:
+                    self.products.update(product_id, {"stock": product["stock"] - quantity})
+        self._transaction(commit)
+
+    def expire(self):
+        """Release every expired reservation (abandoned carts)"""
+        self._transaction(lambda conn, now: conn.execute(
+            "DELETE FROM reservations WHERE expires_at <= ?", (now,)
+        ))
+
+    def load(self, carts, orders):
+        """Import the reservations of the stored carts and pending orders, once per
+        database: the first process to start does it, the others find them there"""
+        def load(conn, now):
+            if conn.execute("SELECT 1 FROM seeded WHERE name = 'reservations'").fetchone():
+                return
+            held = {}
+            for cart in carts:
+                for item in cart.get("items", []):
+                    key = (item["productId"], cart_holder(cart["userId"]))
+                    held[key] = (held.get(key, (0,))[0] + item["quantity"], now + CART_RESERVATION_TTL)
+            for order in orders:
+                if order.get("status") != "pending":
+                    continue
+                for item in order.get("cart_items", []):
+                    key = (item["productId"], order["id"])
+                    held[key] = (held.get(key, (0,))[0] + item["quantity"], None)
+            for (product_id, holder), (quantity, expires_at) in held.items():
+                self._set(conn, product_id, holder, quantity, expires_at)
+            conn.execute("INSERT INTO seeded (name) VALUES ('reservations')")
+        self._transaction(load)
+
+
+def _open_inventory():
+    # Without a shared database (one LogStore per process) reservations are only
+    # known to the process that made them
+    if database.sqlite_db is not None:
+        inventory = SharedInventory(database.products_db, database.sqlite_db,
+                                    refresh=getattr(database.store, "sync", None))
+    else:
+        inventory = Inventory(database.products_db)
+    inventory.load(database.cart_db, database.orders_db)
+    inventory.start_expiry()
+    return inventory
+
+
+def __getattr__(attr):
+    """Module attribute `inventory`, shared by the cart and orders services (reservations
+    of the stored carts and pending orders), is created on first access, so importing
+    the classes alone loads no collection and starts no thread."""
+    if attr != "inventory":
+        raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
+    inventory = globals()[attr] = _open_inventory()
+    return inventory
@@ -3,6 +3,7 @@ import jsonschema
 from functools import wraps
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from utils.query import CursorUnsupported, Query, decode_cursor, encode_cursor
 
 # ✅ Pagination Middleware (Fixes response issue)
 def paginate_data(f):
@@ -14,21 +15,44 @@ def paginate_data(f):
         # Ensure response is properly unpacked (Flask response or tuple)
         if isinstance(response, tuple):
             data, status_code = response
-            data = data.get_json()
         else:
-            data = response.get_json()
-            status_code = 200
+            data, status_code = response, 200
 
         page = int(request.args.get("page", 1))
         limit = int(request.args.get("limit", 10))
+
+        # ✅ Cursor pagination (?after=<cursor>): seek in the ordered index instead of offsetting
+        if isinstance(data, Query) and "after" in request.args:
+            if limit < 1:
+                return jsonify({"error": "limit must be at least 1"}), 400
+            try:
+                results, last = data.seek(decode_cursor(request.args["after"]), limit)
+            except CursorUnsupported as e:
+                return jsonify({"error": f"{e}; use page= instead"}), 400
+            except (ValueError, TypeError):
+                return jsonify({"error": "Invalid cursor"}), 400
+            return jsonify({
+                "limit": limit,
+                "next": encode_cursor(last) if results and len(results) == limit else None,
+                "results": results
+            }), status_code
+
         start = (page - 1) * limit
         end = start + limit
-        paginated_data = data[start:end]
+
+        # ✅ Lazy queries are sliced natively: only the returned page gets encoded
+        if isinstance(data, Query):
+            total = data.count()
+            paginated_data = data.slice(start, end)
+        else:
+            data = data.get_json()
+            total = len(data)
+            paginated_data = data[start:end]
 
         return jsonify({
             "page": page,
             "limit": limit,
-            "total": len(data),
+            "total": total,
             "results": paginated_data
         }), status_code
 
@@ -36,7 +60,10 @@ def paginate_data(f):
 
 # ✅ Filtering & Sorting Middleware (Fixes response issue)
 def filter_and_sort_data(f):
-    """Middleware for filtering and sorting GET requests"""
+    """Middleware for filtering and sorting GET requests.
+
+    Handlers returning a Query get the filter and sort pushed into it and the
+    query is handed on un-encoded, so it must sit under paginate_data."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         response = f(*args, **kwargs)
@@ -44,26 +71,33 @@ def filter_and_sort_data(f):
         # Ensure response is properly unpacked (Flask response or tuple)
         if isinstance(response, tuple):
             data, status_code = response
-            data = data.get_json()
         else:
-            data = response.get_json()
-            status_code = 200
+            data, status_code = response, 200
 
         sort_by = request.args.get("sort_by")
         order = request.args.get("order", "asc")
         filter_key = request.args.get("filter_key")
         filter_value = request.args.get("filter_value")
 
-        # Apply filtering
+        lazy = isinstance(data, Query)
+        if not lazy:
+            data = data.get_json()
+            # Non-list responses (e.g. a single cart) pass through untouched
+            if not isinstance(data, list):
+                return jsonify(data), status_code
+            data = Query(data)
+
+        # Apply filtering (in SQL when the query comes from the SQLite backend)
         if filter_key and filter_value:
-            data = [item for item in data if str(item.get(filter_key, "")).lower() == filter_value.lower()]
+            data = data.where_equal(filter_key, filter_value, ignore_case=True)
 
         # Apply sorting
         if sort_by:
-            reverse = order.lower() == "desc"
-            data = sorted(data, key=lambda x: x.get(sort_by, ""), reverse=reverse)
+            data = data.order_by(sort_by, reverse=order.lower() == "desc")
 
-        return jsonify(data), status_code
+        if lazy:
+            return data, status_code
+        return jsonify(data.all()), status_code
 
     return decorated_function
 def handle_errors(f):
@@ -80,16 +114,24 @@ def handle_errors(f):
             return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
     return decorated_function
 
+def compile_schema(schema):
+    """Check a JSON schema once and return a reusable validator for it"""
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
 # ✅ Validation Middleware
 def validate_json(schema):
     """Middleware to validate JSON requests based on a schema"""
+    # ✅ Compile the schema once instead of on every request
+    validator = compile_schema(schema)
+
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            try:
-                jsonschema.validate(instance=request.json, schema=schema)
-            except jsonschema.exceptions.ValidationError as e:
-                return jsonify({"error": "Invalid request data", "message": str(e)}), 400
+            error = jsonschema.exceptions.best_match(validator.iter_errors(request.json))
+            if error is not None:
+                return jsonify({"error": "Invalid request data", "message": str(error)}), 400
             return f(*args, **kwargs)
         return decorated_function
     return decorator
@@ -104,8 +146,9 @@ def prevent_duplicates(f):
         user_id = data.get("user_id")
         product_id = data.get("product_id")
 
+        user_cart = cart_db.first_by("userId", user_id)
         existing_item = next(
-            (item for item in cart_db if item["user_id"] == user_id and item["product_id"] == product_id),
+            (item for item in (user_cart or {}).get("items", []) if item["productId"] == product_id),
             None
         )
 
@@ -122,7 +165,7 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         from utils.database import users_db
         user_id = request.headers.get("X-User-Id")
-        user = next((u for u in users_db if u["id"] == user_id), None)
+        user = users_db.get(user_id)
 
         if not user or user.get("role") != "admin":
             return jsonify({"error": "Unauthorized. Admin role required."}), 403
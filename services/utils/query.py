@@ -0,0 +1,129 @@
+import base64
+import bisect
+import heapq
+import json
+from itertools import islice
+
+
+def sort_key(record, field):
+    """Position of a record in an ordered index: missing values sort first, ties break on id"""
+    value = record.get(field)
+    return (0, None, record["id"]) if value is None else (1, value, record["id"])
+
+
+def encode_cursor(key):
+    """Opaque cursor for a sort_key() entry"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor(); an empty cursor means the first page. Raises ValueError."""
+    if not cursor:
+        return None
+    key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    if not isinstance(key, list) or len(key) != 3:
+        raise ValueError("Malformed cursor")
+    return tuple(key)
+
+
+class CursorUnsupported(Exception):
+    """seek() was asked for an order no ordered index keeps"""
+
+    def __init__(self, field):
+        super().__init__(f"Cursor pagination is not available when sorting by {field}")
+        self.field = field
+
+
+class Query:
+    """Lazy view over a collection: filtering, sorting and slicing run on the
+    native records, and nothing is serialized until a page is taken.
+
+    seek() walks an ordered index: the source's own (a Collection), or the one
+    given as `ordered_index(field)` with `lookup(record_id)`, e.g. a collection's
+    index within the group of records the source is a bucket of."""
+
+    def __init__(self, source, predicates=(), sort_by=None, reverse=False, ordered_index=None, lookup=None):
+        self.source = source
+        self.predicates = tuple(predicates)
+        self.sort_by = sort_by
+        self.reverse = reverse
+        self.ordered_index = ordered_index or getattr(source, "ordered_index", None)
+        self.lookup = lookup or getattr(source, "get", None)
+        self._matches = None
+
+    def _derive(self, predicates, sort_by, reverse):
+        return Query(self.source, predicates, sort_by, reverse, self.ordered_index, self.lookup)
+
+    def where(self, predicate):
+        """Return a new query keeping only the records for which `predicate(record)` is true"""
+        return self._derive(self.predicates + (predicate,), self.sort_by, self.reverse)
+
+    def where_equal(self, field, value, ignore_case=False):
+        """Return a new query keeping the records whose `field` equals `value`;
+        with ignore_case both are compared as lowercase text"""
+        if ignore_case:
+            value = str(value).lower()
+            return self.where(lambda row: str(row.get(field, "")).lower() == value)
+        return self.where(lambda row: row.get(field) == value)
+
+    def order_by(self, field, reverse=False):
+        """Return a new query sorted on `field`"""
+        return self._derive(self.predicates, field, reverse)
+
+    def _rows(self):
+        if not self.predicates:
+            return self.source
+        # Matching records are collected once (as references) and reused by count() and slice()
+        if self._matches is None:
+            self._matches = [row for row in self.source if all(p(row) for p in self.predicates)]
+        return self._matches
+
+    def count(self):
+        """Number of records matching the query"""
+        return len(self._rows())
+
+    def slice(self, start, stop):
+        """Records [start:stop] of the query result"""
+        rows = self._rows()
+        if self.sort_by is None:
+            return list(islice(rows, start, stop))
+
+        def key(row):
+            return row.get(self.sort_by, "")
+
+        # Partial sort: only the first `stop` rows are ever ordered
+        select = heapq.nlargest if self.reverse else heapq.nsmallest
+        return select(stop, rows, key=key)[start:]
+
+    def seek(self, after, limit):
+        """Keyset pagination on (sort_by or id, id): return up to `limit` records
+        strictly after the `after` key (None for the first page) and the key of
+        the last one returned. O(log n + limit) without predicates; raises
+        CursorUnsupported if no ordered index keeps that order."""
+        field = self.sort_by or "id"
+        keys = self.ordered_index(field) if self.ordered_index else None
+        if keys is None:
+            # Sorting the whole source on every page is what cursors are meant to avoid
+            raise CursorUnsupported(field)
+        lookup, predicates = self.lookup, self.predicates
+
+        if self.reverse:
+            position = (bisect.bisect_left(keys, after) if after else len(keys)) - 1
+            step = -1
+        else:
+            position = bisect.bisect_right(keys, after) if after else 0
+            step = 1
+
+        page, last = [], None
+        while 0 <= position < len(keys) and len(page) < limit:
+            key = keys[position]
+            record = lookup(key[2])
+            if record is not None and all(p(record) for p in predicates):
+                page.append(record)
+                last = key
+            position += step
+        return page, last
+
+    def all(self):
+        """Every record matching the query, in order"""
+        return self.slice(0, self.count())
@@ -0,0 +1,614 @@
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from utils.query import CursorUnsupported, Query
+
+# Fields that may be inlined into SQL as JSON paths; anything else matches no record
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Ids per `WHERE id IN (...)` statement in get_many()
+MAX_VARIABLES = 500
+
+# Number ending a record id ("order-12"): new ids continue after the largest one
+ID_NUMBER = re.compile(r"(\d+)$")
+
+
+class DuplicateId(Exception):
+    """insert() was given a record whose id is already stored"""
+
+    def __init__(self, record_id):
+        super().__init__(f"A record with id {record_id} already exists")
+        self.record_id = record_id
+
+
+class MemoryRepository:
+    """Repository over an in-memory Collection, persisted through a storage engine
+    (LogStore or SharedStore). Queries run on the records in place."""
+
+    def __init__(self, name, store):
+        self.name = name
+        self.store = store
+        self.records = store.collection(name)
+
+    def get(self, record_id, default=None):
+        """The record with this id, or `default`"""
+        return self.records.get(record_id, default)
+
+    def get_many(self, record_ids):
+        """The records with these ids, in the same order; missing ids are skipped"""
+        return [record for record in map(self.records.get, record_ids) if record is not None]
+
+    def find_by(self, field, value):
+        """Records whose `field` equals `value`"""
+        if self.records.has_index(field):
+            return self.records.find_by(field, value)
+        return [record for record in self.records if record.get(field) == value]
+
+    def first_by(self, field, value, default=None):
+        """First record whose `field` equals `value`, or `default`"""
+        if self.records.has_index(field):
+            return self.records.first_by(field, value, default)
+        return next((record for record in self.records if record.get(field) == value), default)
+
+    def query(self, **equals):
+        """Lazy Query over the records whose fields equal `equals`"""
+        query = None
+        for field, value in equals.items():
+            if query is None and self.records.has_index(field):
+                # The bucket of the secondary index, paged by cursor through the ordered
+                # indexes kept within the group, if any
+                query = Query(self.records.find_by(field, value),
+                              ordered_index=functools.partial(self.records.ordered_index, group=(field, value)),
+                              lookup=functools.partial(self._get_in_group, field, value))
+            else:
+                query = (query or Query(self.records)).where_equal(field, value)
+        return query or Query(self.records)
+
+    def _get_in_group(self, field, value, record_id):
+        record = self.records.get(record_id)
+        return record if record is not None and record.get(field) == value else None
+
+    def _check_new(self, records):
+        record_ids = set()
+        for record in records:
+            if record["id"] in record_ids or self.records.get(record["id"]) is not None:
+                raise DuplicateId(record["id"])
+            record_ids.add(record["id"])
+
+    def insert(self, record):
+        """Store a new record; raises DuplicateId if its id is taken"""
+        self._check_new([record])
+        self.records.append(record)
+        self.store.put(self.name, record)
+        return record
+
+    def insert_many(self, records):
+        """Store a batch of new records with one durable write; raises DuplicateId
+        (storing none of them) if one of their ids is taken"""
+        self._check_new(records)
+        self.records.extend(records)
+        self.store.put_many(self.name, records)
+        return records
+
+    def update(self, record_id, changes):
+        """Apply `changes` to a record and store it; returns it, or None if missing"""
+        record = self.records.update(record_id, changes)
+        if record is not None:
+            self.store.put(self.name, record)
+        return record
+
+    def save(self, record):
+        """Store a whole record: a new one, a changed copy, or the stored one changed in place"""
+        if self.records.get(record["id"]) is record:
+            # Changed in place: re-index it and notify listeners
+            self.records.update(record["id"], {})
+        else:
+            record = self.records.upsert(record)
+        self.store.put(self.name, record)
+        return record
+
+    def delete(self, record_id):
+        """Delete a record; returns it, or None if missing"""
+        record = self.records.delete(record_id)
+        if record is not None:
+            self.store.delete(self.name, record_id)
+        return record
+
+    def new_id(self, prefix):
+        """Id for a new record"""
+        return self.store.new_id(self.name, prefix)
+
+    def atomic(self, fn):
+        """Run `fn()`, e.g. a read, a check and the writes it allows, without other writers
+        interleaving (see the store's atomic()); returns its result"""
+        return self.store.atomic(fn)
+
+    def barrier(self, timeout=None):
+        """Wait until the writes made so far are on disk (they are group-committed)"""
+        return self.store.barrier(timeout=timeout)
+
+    def subscribe(self, listener):
+        """Call `listener(op, record)` after every change (see Collection.subscribe)"""
+        self.records.subscribe(listener)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+
+def _path(field):
+    return f"'$.{field}'" if FIELD_NAME.match(field) else None
+
+
+def field_sql(field):
+    """SQL expression of a record field (the id column for `id`)"""
+    if field == "id":
+        return "id"
+    path = _path(field)
+    return f"json_extract(record, {path})" if path else "NULL"
+
+
+def text_sql(field):
+    """SQL expression of a field as lowercase text, like str(record.get(field, "")).lower()"""
+    path = _path(field)
+    if path is None:
+        return "''"
+    return (f"CASE json_type(record, {path}) WHEN 'true' THEN 'true' WHEN 'false' THEN 'false' "
+            f"WHEN 'null' THEN 'none' ELSE lower(COALESCE(json_extract(record, {path}), '')) END")
+
+
+def _last_number(record_ids):
+    """Largest number ending one of these ids, 0 if none does. Sequences start
+    after it rather than after the record count, which deletes make reusable."""
+    return max((int(match.group(1)) for match in map(ID_NUMBER.search, record_ids) if match), default=0)
+
+
+class SQLiteDatabase:
+    """SQLite database in WAL mode shared by the processes of a node. Besides the
+    records (a table per collection for SQLiteRepository, one `records` table for
+    SharedStore) it holds the id sequences and a change feed whose autoincrement
+    version counts every committed write, which is how each process learns of the
+    others' writes."""
+
+    def __init__(self, path, seed=None, indexes=None, aliases=None, retention=100000, prune_every=1000,
+                 watch_interval=0.1):
+        self.path = path
+        self.seed = seed  # name -> records imported when the collection's table is created
+        self.indexes = indexes or {}  # name -> indexed fields
+        self.aliases = aliases or {}  # name -> {older field name: current one}, renamed in stored records
+        self.retention = retention  # Feed entries kept; a process further behind reloads
+        self.prune_every = prune_every
+        self.watch_interval = watch_interval
+        self.writer = uuid.uuid4().hex  # Marks this process's feed entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._schema = False
+        self._tables = set()
+        self._sequenced = set()  # Collections whose sequence was checked against their ids
+        self._logged = 0
+        # Feed watchers, guarded by _watch_lock
+        self._watch_lock = threading.RLock()
+        self._watchers = {}  # name -> [listener]
+        self._notified = {}  # name -> {record_id: feed version last passed to the watchers}
+        self._watched = None  # Feed version the watchers have seen
+
+    def conn(self):
+        """This thread's connection (sqlite3 connections are not shared across threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._lock:
+                if not self._schema:
+                    conn.executescript("""
+                        CREATE TABLE IF NOT EXISTS changes (
+                            version INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, op TEXT NOT NULL,
+                            record_id TEXT NOT NULL, record TEXT, writer TEXT NOT NULL);
+                        CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+                        CREATE TABLE IF NOT EXISTS seeded (name TEXT PRIMARY KEY);
+                    """)
+                    self._schema = True
+            self._local.conn = conn
+        return conn
+
+    def transaction(self, fn, mode="IMMEDIATE"):
+        """Run `fn(conn)` in a transaction and return its result. Called inside another
+        transaction of this thread, `fn` joins it and commits with it."""
+        conn = self.conn()
+        if conn.in_transaction:
+            return fn(conn)
+        conn.execute(f"BEGIN {mode}")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        with self._lock:
+            prune = self._logged >= self.prune_every
+            if prune:
+                self._logged = 0
+        if prune:
+            self.prune()
+        return result
+
+    def barrier(self):
+        """Wait until every committed write is on disk. With synchronous=NORMAL, WAL
+        commits are synced at checkpoints, so this runs one."""
+        self.conn().execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return True
+
+    def log_change(self, conn, name, op, record_id, record):
+        """Append a write to the change feed, inside the transaction making it; returns its version"""
+        with self._lock:
+            self._logged += 1
+        return conn.execute(
+            "INSERT INTO changes (collection, op, record_id, record, writer) VALUES (?, ?, ?, ?, ?)",
+            (name, op, record_id, json.dumps(record) if record is not None else None, self.writer),
+        ).lastrowid
+
+    def latest_version(self, conn):
+        """Version of the last committed write"""
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def changes(self, conn, since):
+        """Feed entries after version `since`, oldest first, as (version, name, op, record_id, record),
+        or None if some of them were pruned already"""
+        if self.latest_version(conn) == since:
+            return []
+        rows = conn.execute(
+            "SELECT version, collection, op, record_id, record FROM changes WHERE version > ? ORDER BY version",
+            (since,)
+        ).fetchall()
+        if rows and rows[0][0] != since + 1:
+            return None
+        return [(version, name, op, record_id, json.loads(record) if record is not None else None)
+                for version, name, op, record_id, record in rows]
+
+    def prune(self):
+        """Drop feed entries older than the retention window (records stay current)"""
+        self.transaction(lambda conn: conn.execute(
+            "DELETE FROM changes WHERE version <= ?", (self.latest_version(conn) - self.retention,)
+        ))
+
+    def new_id(self, name, prefix, record_ids):
+        """Id for a new record, unique across every process sharing the database.
+        `record_ids(conn)` lists the collection's ids: once per process, the sequence
+        is moved past the largest of them, even if it lags behind."""
+        def allocate(conn):
+            if name not in self._sequenced:
+                conn.execute(
+                    "INSERT INTO sequences (name, value) VALUES (?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET value = max(value, excluded.value)",
+                    (name, _last_number(record_ids(conn))),
+                )
+            return conn.execute(
+                "UPDATE sequences SET value = value + 1 WHERE name = ? RETURNING value", (name,)
+            ).fetchall()[0][0]
+
+        value = self.transaction(allocate)
+        self._sequenced.add(name)
+        return f"{prefix}-{value}"
+
+    def table(self, name):
+        """Create a collection's table and indexes, importing its records the first time"""
+        with self._lock:
+            if name in self._tables:
+                return
+        def create(conn):
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (id TEXT PRIMARY KEY, record TEXT NOT NULL)')
+            for fields in self.indexes.get(name, ()):
+                # A field, or a (group, field) pair indexed together
+                fields = (fields,) if isinstance(fields, str) else tuple(fields)
+                if fields != ("id",):
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_{"_".join(fields)}" ON "{name}" '
+                                 f'({", ".join(map(field_sql, fields))}, id)')
+            if not conn.execute("SELECT 1 FROM seeded WHERE name = ?", (name,)).fetchone():
+                conn.executemany(
+                    f'INSERT OR REPLACE INTO "{name}" (id, record) VALUES (?, ?)',
+                    [(record["id"], json.dumps(record)) for record in self.seed(name)],
+                )
+                conn.execute("INSERT INTO seeded (name) VALUES (?)", (name,))
+            # Tables seeded before a field was renamed still hold the older spelling
+            for old, new in self.aliases.get(name, {}).items():
+                if FIELD_NAME.match(old) and FIELD_NAME.match(new):
+                    conn.execute(
+                        f"""UPDATE "{name}" SET record = json_remove(json_set(record, '$.{new}', json_extract(record, '$.{old}')), '$.{old}')
+                            WHERE json_type(record, '$.{old}') IS NOT NULL AND json_type(record, '$.{new}') IS NULL"""
+                    )
+        self.transaction(create)
+        with self._lock:
+            self._tables.add(name)
+
+    def watch(self, name, listener):
+        """Call `listener(op, record)` for every write to a collection, made by this
+        process or (within watch_interval) another one: op is "put", "delete", or
+        "reset" when the feed entries needed were pruned"""
+        with self._watch_lock:
+            if self._watched is None:
+                self._watched = self.latest_version(self.conn())
+                if self.watch_interval:
+                    threading.Thread(target=self._watch_loop, daemon=True).start()
+            self._watchers.setdefault(name, []).append(listener)
+            self._notified.setdefault(name, {})
+
+    def notify(self, name, op, record, version):
+        """Pass the write at feed `version` to the collection's watchers, unless they
+        saw it, or a later write of the same record, already"""
+        with self._watch_lock:
+            notified = self._notified.get(name)
+            if notified is None or notified.get(record["id"], 0) >= version:
+                return
+            notified[record["id"]] = version
+            for listener in self._watchers[name]:
+                listener(op, record)
+
+    def poll(self):
+        """Pass the writes committed since the last poll to the watchers, in version order"""
+        conn = self.conn()
+        with self._watch_lock:
+            if self._watched is None:
+                return
+            rows = self.changes(conn, self._watched)
+            if rows is None:
+                self._watched = self.latest_version(conn)
+                for listeners in self._watchers.values():
+                    for listener in listeners:
+                        listener("reset", None)
+                return
+            for version, name, op, record_id, record in rows:
+                if record is not None:
+                    self.notify(name, op, record, version)
+            if rows:
+                self._watched = rows[-1][0]
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.watch_interval)
+            try:
+                self.poll()
+            except sqlite3.Error:
+                # The database is busy or briefly unavailable: retry on the next tick
+                continue
+
+
+class SQLiteRepository:
+    """Repository over one table of a SQLiteDatabase: lookups, filters, sorting and
+    pagination run as indexed SQL, and records are only decoded when returned.
+    Every write is logged to the database's change feed in the same transaction."""
+
+    def __init__(self, name, database):
+        self.name = name
+        self.database = database
+        database.table(name)
+
+    def _select(self, sql, params=()):
+        rows = self.database.conn().execute(f'SELECT record FROM "{self.name}" {sql}', params)
+        return [json.loads(record) for (record,) in rows]
+
+    def get(self, record_id, default=None):
+        """The record with this id, or `default`"""
+        records = self._select("WHERE id = ?", (record_id,))
+        return records[0] if records else default
+
+    def get_many(self, record_ids):
+        """The records with these ids, in the same order; missing ids are skipped"""
+        record_ids = list(record_ids)
+        found = {}
+        for start in range(0, len(record_ids), MAX_VARIABLES):
+            chunk = record_ids[start:start + MAX_VARIABLES]
+            for record in self._select(f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+                found[record["id"]] = record
+        return [found[record_id] for record_id in record_ids if record_id in found]
+
+    def find_by(self, field, value):
+        """Records whose `field` equals `value`"""
+        return self.query(**{field: value}).all()
+
+    def first_by(self, field, value, default=None):
+        """First record whose `field` equals `value`, or `default`"""
+        records = self.query(**{field: value}).slice(0, 1)
+        return records[0] if records else default
+
+    def query(self, **equals):
+        """Lazy SQLQuery over the records whose fields equal `equals`"""
+        query = SQLQuery(self)
+        for field, value in equals.items():
+            query = query.where_equal(field, value)
+        return query
+
+    def subscribe(self, listener):
+        """Call `listener(op, record)` after every change, including those other processes make
+        (see SQLiteDatabase.watch)"""
+        self.database.watch(self.name, listener)
+
+    def _put(self, conn, record):
+        conn.execute(f'INSERT OR REPLACE INTO "{self.name}" (id, record) VALUES (?, ?)',
+                     (record["id"], json.dumps(record)))
+        return self.database.log_change(conn, self.name, "put", record["id"], record)
+
+    def _notify(self, op, records, versions):
+        for record, version in zip(records, versions):
+            self.database.notify(self.name, op, record, version)
+
+    def insert(self, record):
+        """Store a new record; raises DuplicateId if its id is taken"""
+        return self.insert_many([record])[0]
+
+    def insert_many(self, records):
+        """Store a batch of new records in one transaction; raises DuplicateId
+        (storing none of them) if one of their ids is taken"""
+        def insert(conn):
+            versions = []
+            for record in records:
+                try:
+                    conn.execute(f'INSERT INTO "{self.name}" (id, record) VALUES (?, ?)',
+                                 (record["id"], json.dumps(record)))
+                except sqlite3.IntegrityError:
+                    raise DuplicateId(record["id"]) from None
+                versions.append(self.database.log_change(conn, self.name, "put", record["id"], record))
+            return versions
+
+        self._notify("put", records, self.database.transaction(insert))
+        return records
+
+    def update(self, record_id, changes):
+        """Apply `changes` to a record and store it; returns it, or None if missing"""
+        def update(conn):
+            row = conn.execute(f'SELECT record FROM "{self.name}" WHERE id = ?', (record_id,)).fetchone()
+            if row is None:
+                return None
+            record = dict(json.loads(row[0]), **changes)
+            return record, self._put(conn, record)
+
+        record, version = self.database.transaction(update) or (None, None)
+        if record is not None:
+            self._notify("put", [record], [version])
+        return record
+
+    def save(self, record):
+        """Store a whole record, replacing the stored one with the same id"""
+        version = self.database.transaction(lambda conn: self._put(conn, record))
+        self._notify("put", [record], [version])
+        return record
+
+    def delete(self, record_id):
+        """Delete a record; returns it, or None if missing"""
+        def delete(conn):
+            row = conn.execute(f'DELETE FROM "{self.name}" WHERE id = ? RETURNING record', (record_id,)).fetchall()
+            if not row:
+                return None
+            # The feed keeps the deleted record, which listeners are passed
+            record = json.loads(row[0][0])
+            return record, self.database.log_change(conn, self.name, "delete", record_id, record)
+
+        record, version = self.database.transaction(delete) or (None, None)
+        if record is not None:
+            self._notify("delete", [record], [version])
+        return record
+
+    def new_id(self, prefix):
+        """Id for a new record, unique across every process sharing the database"""
+        return self.database.new_id(self.name, prefix,
+                                    lambda conn: (record_id for (record_id,) in conn.execute(f'SELECT id FROM "{self.name}"')))
+
+    def atomic(self, fn):
+        """Run `fn()` in one transaction, holding the database for writing against
+        every process; returns its result"""
+        return self.database.transaction(lambda conn: fn())
+
+    def barrier(self, timeout=None):
+        """Wait until the writes made so far are on disk"""
+        return self.database.barrier()
+
+    def __iter__(self):
+        return iter(self.query().all())
+
+    def __len__(self):
+        return self.query().count()
+
+
+class SQLQuery(Query):
+    """Query over a SQLiteRepository: equality filters, sorting, offsets and keyset
+    seeks are pushed down to SQL, so only the returned page is read and decoded."""
+
+    def __init__(self, repository, conditions=(), params=(), sort_by=None, reverse=False):
+        self.repository = repository
+        self.conditions = tuple(conditions)
+        self.params = tuple(params)
+        self.sort_by = sort_by
+        self.reverse = reverse
+
+    def _where(self, conditions=None):
+        conditions = self.conditions if conditions is None else conditions
+        return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    def _order(self):
+        if self.sort_by is None:
+            return "ORDER BY rowid"
+        direction = "DESC" if self.reverse else "ASC"
+        return f"ORDER BY {field_sql(self.sort_by)} {direction}, id {direction}"
+
+    def where(self, predicate):
+        """Python predicates cannot run in SQL: the rows matching so far are filtered in memory"""
+        return Query(self.repository._select(self._where(), self.params), (predicate,), self.sort_by, self.reverse)
+
+    def where_equal(self, field, value, ignore_case=False):
+        """Return a new query keeping the records whose `field` equals `value`"""
+        if ignore_case:
+            condition, value = f"{text_sql(field)} = ?", str(value).lower()
+        else:
+            condition = f"{field_sql(field)} = ?"
+        return SQLQuery(self.repository, self.conditions + (condition,), self.params + (value,),
+                        self.sort_by, self.reverse)
+
+    def order_by(self, field, reverse=False):
+        """Return a new query sorted on `field`"""
+        return SQLQuery(self.repository, self.conditions, self.params, field, reverse)
+
+    def count(self):
+        """Number of records matching the query"""
+        conn = self.repository.database.conn()
+        return conn.execute(f'SELECT count(*) FROM "{self.repository.name}" {self._where()}', self.params).fetchone()[0]
+
+    def slice(self, start, stop):
+        """Records [start:stop] of the query result"""
+        return self.repository._select(f"{self._where()} {self._order()} LIMIT ? OFFSET ?",
+                                       self.params + (max(stop - start, 0), start))
+
+    def seek(self, after, limit):
+        """Keyset pagination on (sort_by or id, id), with the same keys as Query.seek();
+        raises CursorUnsupported unless an index keeps that order"""
+        field = self.sort_by or "id"
+        indexed = {fields if isinstance(fields, str) else fields[-1]
+                   for fields in self.repository.database.indexes.get(self.repository.name, ())}
+        if field != "id" and field not in indexed:
+            raise CursorUnsupported(field)
+        value_sql = field_sql(field)
+        # Records missing the field come first (like sort_key()), then by value, then by id.
+        # Each bound starts with a range on the field, so the field's index can seek to it.
+        if not after:
+            segments = [(None, [])]
+        else:
+            flag, value, record_id = after
+            if not self.reverse:
+                segments = [(f"{value_sql} >= ? AND ({value_sql} > ? OR id > ?)", [value, value, record_id])] if flag else \
+                    [(f"{value_sql} IS NULL AND id > ?", [record_id]), (f"{value_sql} IS NOT NULL", [])]
+            else:
+                segments = [(f"{value_sql} <= ? AND ({value_sql} < ? OR id < ?)", [value, value, record_id]),
+                            (f"{value_sql} IS NULL", [])] if flag else \
+                    [(f"{value_sql} IS NULL AND id < ?", [record_id])]
+
+        direction = "DESC" if self.reverse else "ASC"
+        rows = []
+        for condition, params in segments:
+            if len(rows) >= limit:
+                break
+            conditions = self.conditions + ((condition,) if condition else ())
+            rows += self.repository.database.conn().execute(
+                f'SELECT id, {value_sql}, record FROM "{self.repository.name}" {self._where(conditions)} '
+                f"ORDER BY {value_sql} {direction}, id {direction} LIMIT ?",
+                self.params + tuple(params) + (limit - len(rows),)
+            ).fetchall()
+
+        page = [json.loads(record) for _, _, record in rows]
+        last = None
+        if rows:
+            record_id, value, _ = rows[-1]
+            last = (0, None, record_id) if value is None else (1, value, record_id)
+        return page, last
+
+    def all(self):
+        """Every record matching the query, in order"""
+        return self.repository._select(f"{self._where()} {self._order()}", self.params)
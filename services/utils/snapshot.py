@@ -0,0 +1,148 @@
+"""Binary snapshots of the JSON data files.
+
+A snapshot sits next to its data file (products.json -> products.snap) and holds
+the same records, marshalled: repeated keys and strings are stored once, and
+loading skips JSON parsing. It is only used while it is fresh, i.e. the data
+file still has the size, mtime and CRC32 of its bytes recorded in the header
+(the checksum catches a same-size rewrite within the mtime granularity).
+
+Layout (little-endian), HEADER then the payload:
+  magic "PSNP", format version (2), interpreter tag (16 bytes, e.g. b"cpython-3.11"),
+  marshal version, record count, source size, source mtime (ns), source CRC32,
+  payload size, payload CRC32; the payload is marshal.dumps(list of records).
+
+marshal's format is only stable within one interpreter version, so a snapshot is
+tied to the interpreter that wrote it: any other one rejects it (SnapshotError)
+and the data file is read from JSON and re-snapshotted. The file is mapped with
+mmap to checksum it without reading it into a buffer first; decoding builds the
+records as new objects either way.
+
+Usage (from services/): python -m utils.snapshot {to-snapshot,to-json} [collection ...]
+"""
+import argparse
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+MAGIC = b"PSNP"
+FORMAT_VERSION = 2
+
+# Interpreter whose marshal format the payload uses
+INTERPRETER = f"{sys.implementation.name}-{sys.version_info[0]}.{sys.version_info[1]}".encode()
+
+# magic, format version, interpreter, marshal version, records, source size, source mtime (ns),
+# source crc32, payload size, payload crc32
+HEADER = struct.Struct("<4sH16sHQQqIQI")
+
+
+class SnapshotError(Exception):
+    """A snapshot file is truncated, corrupt, of another format version or written by another interpreter"""
+
+
+def snapshot_path(source_path):
+    """Snapshot file of a JSON data file"""
+    return os.path.splitext(source_path)[0] + ".snap"
+
+
+def file_crc(path):
+    """CRC32 of a file's bytes"""
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return zlib.crc32(b"")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return zlib.crc32(mapped)
+
+
+def write_snapshot(source_path, records, source_crc=None):
+    """Write the snapshot of `records`, the current content of `source_path`
+    (`source_crc`: the CRC32 of its bytes, if the caller has them at hand)"""
+    source = os.stat(source_path)
+    if source_crc is None:
+        source_crc = file_crc(source_path)
+    payload = marshal.dumps(records)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, INTERPRETER, marshal.version, len(records),
+                         source.st_size, source.st_mtime_ns, source_crc, len(payload), zlib.crc32(payload))
+    path = snapshot_path(source_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(header)
+        file.write(payload)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(source_path, check_fresh=True):
+    """Records of the snapshot of `source_path`, or None if there is none or it is stale.
+    Raises SnapshotError if the file is corrupt or was written by another interpreter."""
+    path = snapshot_path(source_path)
+    try:
+        file = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with file:
+        size = os.fstat(file.fileno()).st_size
+        if size < HEADER.size:
+            raise SnapshotError(f"{path}: truncated header")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, version, interpreter, marshal_version, count, source_size, source_mtime, source_crc, \
+                length, crc = HEADER.unpack_from(mapped)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise SnapshotError(f"{path}: unsupported format")
+            interpreter = interpreter.rstrip(b"\0")
+            if interpreter != INTERPRETER or marshal_version != marshal.version:
+                raise SnapshotError(f"{path}: written by {interpreter.decode(errors='replace')}")
+            if check_fresh:
+                try:
+                    source = os.stat(source_path)
+                except FileNotFoundError:
+                    return None
+                if (source.st_size, source.st_mtime_ns) != (source_size, source_mtime):
+                    return None
+                if file_crc(source_path) != source_crc:
+                    return None
+            if HEADER.size + length != size:
+                raise SnapshotError(f"{path}: truncated payload")
+            with memoryview(mapped)[HEADER.size:] as payload:
+                if zlib.crc32(payload) != crc:
+                    raise SnapshotError(f"{path}: checksum mismatch")
+                records = marshal.loads(payload)
+    if not isinstance(records, list) or len(records) != count:
+        raise SnapshotError(f"{path}: unexpected content")
+    return records
+
+
+def main(args):
+    from utils.database import DataFiles, data_dir, _write_json
+
+    data = DataFiles(args.data_dir or data_dir)
+    manifest = data.manifest()["collections"]
+    for name in args.collections or list(manifest):
+        if name not in manifest:
+            raise SystemExit(f"unknown collection: {name}")
+        source_path = os.path.join(data.data_dir, manifest[name]["file"])
+        if args.command == "to-snapshot":
+            with open(source_path, "r", encoding="utf-8") as file:
+                records = json.load(file)
+            target = snapshot_path(source_path)
+        else:
+            records = read_snapshot(source_path, check_fresh=False)
+            if records is None:
+                raise SystemExit(f"no snapshot for {name}")
+            _write_json(source_path, records)
+            target = source_path
+        # Written last, so the snapshot matches the JSON file's new size, mtime and checksum
+        write_snapshot(source_path, records)
+        print(f"{name}: {len(records)} records -> {target}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert data files between JSON and binary snapshots")
+    parser.add_argument("command", choices=["to-snapshot", "to-json"])
+    parser.add_argument("collections", nargs="*", help="collections to convert (default: all)")
+    parser.add_argument("--data-dir", help="data directory (default: DB_DATA_DIR)")
+    main(parser.parse_args())
@@ -0,0 +1,95 @@
+"""Benchmark collection load time from JSON data files against binary snapshots.
+
+Generates synthetic products and orders in a temporary data directory, then
+loads each collection in a fresh process, once from the JSON file and once from
+its snapshot, and reports wall time and peak RSS.
+
+Usage (from services/): python -m utils.startup_benchmark [--products 1000000] [--orders 1000000]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVICES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def generate(data_dir, products, orders):
+    """Write synthetic data files shaped like the real ones, with their snapshots"""
+    from utils.database import DataFiles
+
+    data = DataFiles(data_dir, snapshots=True)
+    data.write("products", [{
+        "id": f"prod-{i}",
+        "name": f"Producto {i}",
+        "description": "Collar de cuero genuino para perros de tamaño mediano",
+        "price": round(5 + i % 500 * 0.37, 2),
+        "category": f"cat-{i % 20:03d}",
+        "animalType": ("Perro", "Gato", "Ave", "Pez")[i % 4],
+        "brand": f"Marca {i % 50}",
+        "stock": i % 100,
+        "images": [f"https://example.com/images/{i}.jpg"],
+        "averageRating": i % 5 + 0.5,
+        "createdAt": "2023-01-15T10:30:00Z",
+    } for i in range(products)])
+    data.write("orders", [{
+        "id": f"order-{i}",
+        "user_id": f"user-{i % 10000}",
+        "cart_items": [{"productId": f"prod-{i % max(products, 1)}", "quantity": 1 + i % 3, "price": 19.99}],
+        "total_price": 19.99 * (1 + i % 3),
+        "status": ("pending", "confirmed", "shipped")[i % 3],
+        "createdAt": "2023-02-01T12:00:00Z",
+    } for i in range(orders)])
+
+
+def load(data_dir, name, snapshots):
+    """Time one collection load in this (fresh) process"""
+    from utils.database import DataFiles
+
+    start = time.perf_counter()
+    records = DataFiles(data_dir, snapshots=snapshots).read(name)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "collection": name,
+        "source": "snapshot" if snapshots else "json",
+        "records": len(records),
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as data_dir:
+        generate(data_dir, args.products, args.orders)
+        for name in ("products", "orders"):
+            size = os.path.getsize(os.path.join(data_dir, f"{name}.json")) / 2 ** 20
+            print(json.dumps({"collection": name, "json_mb": round(size, 1)}))
+            size = os.path.getsize(os.path.join(data_dir, f"{name}.snap")) / 2 ** 20
+            print(json.dumps({"collection": name, "snapshot_mb": round(size, 1)}))
+            for source in ("json", "snapshot"):
+                result = subprocess.run(
+                    [sys.executable, "-m", "utils.startup_benchmark", "--role", "load",
+                     "--data-dir", data_dir, "--collection", name, "--source", source],
+                    cwd=SERVICES_DIR, capture_output=True, text=True, check=True,
+                )
+                print(result.stdout.strip())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--role", choices=["bench", "load"], default="bench")
+    parser.add_argument("--products", type=int, default=1000000)
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--data-dir")
+    parser.add_argument("--collection")
+    parser.add_argument("--source", choices=["json", "snapshot"])
+    args = parser.parse_args()
+
+    if args.role == "load":
+        load(args.data_dir, args.collection, args.source == "snapshot")
+    else:
+        main(args)